@@ -0,0 +1,149 @@
+"""
+Generated PDFs for benchmarks, so runs are repeatable and need no sample documents.
+
+    python -m bench.corpus /tmp/supaocr-corpus --documents 2 --pages 10
+
+"scanned" documents are image-only pages that go to the vision model, "digital" ones
+have a clean text layer that the text layer fast path converts locally when it is
+enabled with TEXT_LAYER_MIN_QUALITY, and "mixed" ones alternate between the two.
+"""
+import argparse
+import io
+import os
+import random
+from typing import List, Sequence
+
+from PIL import Image, ImageDraw
+from PyPDF2 import PdfReader, PdfWriter
+
+KINDS = ("scanned", "digital", "mixed")
+
+WORDS = (
+    "revenue quarter growth region account customer contract product market report "
+    "operating margin forecast budget headcount service platform delivery partner "
+    "invoice payment supplier inventory shipment review policy summary outlook"
+).split()
+
+# US Letter at 150 DPI for scanned pages, in points for text pages
+SCAN_SIZE = (1275, 1650)
+PAGE_SIZE = (612, 792)
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 14))]
+    return " ".join(words).capitalize() + "."
+
+
+def _lines(rng: random.Random, count: int) -> List[str]:
+    return [_sentence(rng) for _ in range(count)]
+
+
+def scanned_pdf(pages: int, seed: int = 0) -> bytes:
+    """Image-only pages with a heading, body text and a table, like a scanned report."""
+    rng = random.Random(seed)
+    images = []
+    for number in range(1, pages + 1):
+        image = Image.new("RGB", SCAN_SIZE, "white")
+        draw = ImageDraw.Draw(image)
+        draw.text((120, 120), f"SECTION {number}", fill="black")
+        y = 200
+        for line in _lines(rng, 24):
+            draw.text((120, y), line, fill="black")
+            y += 32
+        for row in range(5):
+            for column in range(4):
+                left, top = 120 + column * 250, y + 40 + row * 50
+                draw.rectangle((left, top, left + 250, top + 50), outline="black")
+                draw.text((left + 12, top + 18), f"{rng.randint(100, 999)}", fill="black")
+        images.append(image)
+
+    with io.BytesIO() as buffer:
+        images[0].save(buffer, format="PDF", resolution=150, save_all=True, append_images=images[1:])
+        return buffer.getvalue()
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def digital_pdf(pages: int, seed: int = 0) -> bytes:
+    """Pages with an embedded Helvetica text layer, like a PDF exported from a word processor."""
+    rng = random.Random(seed)
+    objects: List[bytes] = [b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    contents = []
+    for number in range(1, pages + 1):
+        lines = [f"SECTION {number}"] + _lines(rng, 30)
+        ops = ["BT /F1 10 Tf 14 TL 60 740 Td"] + [f"({_escape(line)}) '" for line in lines] + ["ET"]
+        stream = "\n".join(ops).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        contents.append(len(objects))
+
+    pages_id = len(objects) + pages + 1
+    kids = []
+    for content in contents:
+        objects.append(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R"
+            b" /Resources << /Font << /F1 1 0 R >> >> >>" % (pages_id, *PAGE_SIZE, content)
+        )
+        kids.append(len(objects))
+    objects.append(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % kid for kid in kids), pages))
+    objects.append(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, len(objects), xref)
+    return out
+
+
+def mixed_pdf(pages: int, seed: int = 0) -> bytes:
+    """Alternating text layer and scanned pages, starting with a text layer page."""
+    digital = PdfReader(io.BytesIO(digital_pdf(pages, seed)))
+    scanned = PdfReader(io.BytesIO(scanned_pdf(pages, seed)))
+    writer = PdfWriter()
+    for index in range(pages):
+        writer.add_page((digital if index % 2 == 0 else scanned).pages[index])
+    with io.BytesIO() as buffer:
+        writer.write(buffer)
+        return buffer.getvalue()
+
+
+def build_corpus(
+    directory: str,
+    documents: int = 2,
+    pages: int = 5,
+    kinds: Sequence[str] = KINDS,
+) -> List[str]:
+    """Write `documents` PDFs of each kind to `directory`, reusing ones already there."""
+    builders = {"scanned": scanned_pdf, "digital": digital_pdf, "mixed": mixed_pdf}
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for kind in kinds:
+        for index in range(documents):
+            path = os.path.join(directory, f"{kind}-{pages}p-{index}.pdf")
+            if not os.path.exists(path):
+                with open(path, "wb") as f:
+                    f.write(builders[kind](pages, seed=index))
+            paths.append(path)
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--documents", type=int, default=2)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=list(KINDS))
+    args = parser.parse_args()
+
+    for path in build_corpus(args.directory, args.documents, args.pages, args.kinds):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
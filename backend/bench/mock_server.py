@@ -0,0 +1,122 @@
+"""
+OpenAI-compatible chat completions server with configurable latency, so the backend
+can be benchmarked without network access or API spend.
+
+    python -m bench.mock_server --port 8199 --latency 0.5 --jitter 0.1
+
+Point the backend at it with OPENAI_API_BASE=http://127.0.0.1:8199/v1.
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from typing import Optional, Tuple
+
+from aiohttp import web
+
+PAGE_MARKDOWN = """# Quarterly Report
+
+Revenue grew across every region during the quarter, led by new enterprise accounts.
+
+| Region | Revenue | Growth |
+|--------|---------|--------|
+| North  | 1.2M    | 8%     |
+| South  | 0.9M    | 5%     |
+
+- Operating costs were flat
+- Headcount grew by 4%
+"""
+
+# Roughly what the OpenAI API bills for one low-detail page image
+IMAGE_TOKENS = 765
+
+
+def create_app(
+    latency: float = 0.5,
+    jitter: float = 0.1,
+    error_rate: float = 0.0,
+    seed: Optional[int] = None,
+) -> web.Application:
+    """
+    :param latency: Mean seconds before each completion is returned
+    :param jitter: Latency varies uniformly by up to this many seconds either way
+    :param error_rate: Share of requests answered with a 429 rate limit error
+    :param seed: Seed for latency and error sampling, for repeatable runs
+    """
+    rng = random.Random(seed)
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app["requests"] = 0
+
+    async def chat_completions(request: web.Request) -> web.Response:
+        body = await request.json()
+        app["requests"] += 1
+        await asyncio.sleep(max(0.0, latency + rng.uniform(-jitter, jitter)))
+
+        if rng.random() < error_rate:
+            return web.json_response(
+                {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error",
+                           "code": "rate_limit_exceeded"}},
+                status=429,
+            )
+
+        prompt_tokens = 0
+        for message in body.get("messages", []):
+            content = message.get("content")
+            if isinstance(content, str):
+                prompt_tokens += len(content) // 4
+            else:
+                prompt_tokens += IMAGE_TOKENS * len(content or [])
+        completion_tokens = len(PAGE_MARKDOWN) // 4
+
+        return web.json_response({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": PAGE_MARKDOWN},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    async def models(request: web.Request) -> web.Response:
+        return web.json_response({"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model"}]})
+
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_get("/v1/models", models)
+    return app
+
+
+async def start(host: str = "127.0.0.1", port: int = 0, **options) -> Tuple[web.AppRunner, str]:
+    """Start the server in the running event loop. Returns the runner and the API base URL."""
+    runner = web.AppRunner(create_app(**options))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = runner.addresses[0][1]
+    return runner, f"http://{host}:{bound_port}/v1"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8199)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    app = create_app(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=args.seed)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Benchmark the backend offline against the mock model server and a generated corpus.
+
+    cd backend
+    python -m bench.run --concurrency 1 4 16 --requests 24 --latency 0.5 --output bench.json
+    python -m bench.run --concurrency 1 4 16 --requests 24 --latency 0.5 --baseline bench.json
+
+Each concurrency level runs in a fresh process, in-process against the FastAPI app,
+so peak memory is measured per level. Reports throughput, p50/p99 request latency,
+peak memory of the server and of its poppler child processes, and mean time per
+pipeline stage. With --baseline, exits non-zero when a level's throughput, p99 latency
+or either peak memory regresses beyond --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import resource
+import sys
+import tempfile
+from time import perf_counter
+from typing import Dict, List, Optional
+
+from bench import mock_server
+from bench.corpus import KINDS, build_corpus
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile, q in [0, 100]."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), math.ceil(q / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def _count_pages(endpoint: str, response) -> int:
+    if endpoint == "/convert/stream":
+        records = [json.loads(line) for line in response.text.splitlines() if line]
+        return sum(1 for record in records if record["type"] == "page")
+    return len(response.json()["pages"])
+
+
+async def run_level(paths: List[str], concurrency: int, requests: int, endpoint: str = "/convert") -> dict:
+    """
+    Send `requests` uploads through the app with `concurrency` clients in flight.
+
+    Must run in a process whose environment already points the backend at the mock
+    server, since main is configured at import time.
+    """
+    import httpx
+    import main
+    from metrics import metrics
+
+    documents = []
+    for path in paths:
+        with open(path, "rb") as f:
+            documents.append((os.path.basename(path), f.read()))
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def send(index: int):
+            name, data = documents[index % len(documents)]
+            return await client.post(endpoint, files={"file": (name, data, "application/pdf")})
+
+        # Untimed: validates the model and warms imports and caches
+        await send(0)
+        stages_before = metrics.stage_totals()
+
+        latencies: List[float] = []
+        pages = errors = 0
+        next_request = 0
+
+        async def client_loop() -> None:
+            nonlocal next_request, pages, errors
+            while next_request < requests:
+                index = next_request
+                next_request += 1
+                start = perf_counter()
+                response = await send(index)
+                latencies.append(perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+                else:
+                    pages += _count_pages(endpoint, response)
+
+        start = perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        wall = perf_counter() - start
+
+    stages = {}
+    for stage, (count, seconds) in metrics.stage_totals().items():
+        count -= stages_before.get(stage, (0, 0.0))[0]
+        seconds -= stages_before.get(stage, (0, 0.0))[1]
+        if count:
+            stages[stage] = {"count": count, "mean_ms": round(seconds / count * 1000, 3)}
+
+    # ru_maxrss is in KB on Linux. Poppler renders in child processes, so their largest
+    # peak is reported separately; RUSAGE_SELF alone would miss rasterization memory.
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "pages": pages,
+        "wall_seconds": round(wall, 3),
+        "requests_per_second": round(requests / wall, 3),
+        "pages_per_second": round(pages / wall, 3),
+        "p50_seconds": round(percentile(latencies, 50), 3),
+        "p99_seconds": round(percentile(latencies, 99), 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_child_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "stages": stages,
+    }
+
+
+def benchmark_env(api_base: str, work_dir: str, cache: bool) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_API_BASE": api_base,
+        "JOBS_DIR": os.path.join(work_dir, "jobs"),
+        "LOG_LEVEL": "WARNING",
+        "LITELLM_VERBOSE": "false",
+        # litellm otherwise fetches its model cost map over the network at import
+        "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+    })
+    if not cache:
+        # Every request reuses the same documents, which would otherwise all be cache hits
+        env.update({"PAGE_CACHE_MEMORY_ENTRIES": "0", "PAGE_CACHE_DIR": ""})
+    return env
+
+
+async def run_levels(args: argparse.Namespace, paths: List[str]) -> List[dict]:
+    runner, api_base = await mock_server.start(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=args.seed
+    )
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            env = benchmark_env(api_base, work_dir, args.cache)
+            for concurrency in args.concurrency:
+                result_file = os.path.join(work_dir, f"level-{concurrency}.json")
+                process = await asyncio.create_subprocess_exec(
+                    sys.executable, "-m", "bench.run", "--worker",
+                    "--concurrency", str(concurrency),
+                    "--requests", str(args.requests),
+                    "--endpoint", args.endpoint,
+                    "--result-file", result_file,
+                    *paths,
+                    cwd=BACKEND_DIR, env=env,
+                    stdout=asyncio.subprocess.DEVNULL,
+                )
+                if await process.wait() != 0:
+                    raise RuntimeError(f"Benchmark worker for concurrency {concurrency} failed")
+                with open(result_file) as f:
+                    results.append(json.load(f))
+                print_result(results[-1])
+    finally:
+        await runner.cleanup()
+    return results
+
+
+def print_result(result: dict) -> None:
+    print(
+        f"concurrency {result['concurrency']:>3}: "
+        f"{result['requests_per_second']:8.2f} req/s {result['pages_per_second']:8.2f} pages/s  "
+        f"p50 {result['p50_seconds']:6.3f}s p99 {result['p99_seconds']:6.3f}s  "
+        f"peak {result['peak_rss_mb']:7.1f} MB children {result['peak_child_rss_mb']:7.1f} MB  "
+        f"errors {result['errors']}"
+    )
+    stages = ", ".join(f"{stage} {info['mean_ms']:.1f}ms" for stage, info in sorted(result["stages"].items()))
+    print(f"  stages: {stages}")
+
+
+def compare(results: List[dict], baseline: List[dict], tolerance: float) -> List[str]:
+    """Regressions of each level against the baseline run, as readable messages."""
+    previous = {result["concurrency"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        before: Optional[dict] = previous.get(result["concurrency"])
+        if before is None:
+            continue
+        level = f"concurrency {result['concurrency']}"
+        if result["requests_per_second"] < before["requests_per_second"] * (1 - tolerance):
+            regressions.append(f"{level}: throughput {before['requests_per_second']} -> {result['requests_per_second']} req/s")
+        if result["p99_seconds"] > before["p99_seconds"] * (1 + tolerance):
+            regressions.append(f"{level}: p99 {before['p99_seconds']} -> {result['p99_seconds']} s")
+        if result["peak_rss_mb"] > before["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{level}: peak memory {before['peak_rss_mb']} -> {result['peak_rss_mb']} MB")
+        # Baselines recorded before child memory was measured have no figure to compare against
+        if "peak_child_rss_mb" in before and result["peak_child_rss_mb"] > before["peak_child_rss_mb"] * (1 + tolerance):
+            regressions.append(
+                f"{level}: peak child memory {before['peak_child_rss_mb']} -> {result['peak_child_rss_mb']} MB"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=24, help="Timed requests per concurrency level")
+    parser.add_argument("--endpoint", choices=["/convert", "/convert/stream"], default="/convert")
+    parser.add_argument("--latency", type=float, default=0.5, help="Mean mock model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of mock calls answered with 429")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus", help="Directory for generated PDFs, defaults to a temporary one")
+    parser.add_argument("--documents", type=int, default=2, help="Documents per kind")
+    parser.add_argument("--pages", type=int, default=5, help="Pages per document")
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=list(KINDS))
+    parser.add_argument("--cache", action="store_true", help="Keep the page cache enabled")
+    parser.add_argument("--output", help="Write results as JSON")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    parser.add_argument("paths", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = asyncio.run(run_level(args.paths, args.concurrency[0], args.requests, args.endpoint))
+        with open(args.result_file, "w") as f:
+            json.dump(result, f)
+        return
+
+    with tempfile.TemporaryDirectory() as default_corpus:
+        paths = build_corpus(args.corpus or default_corpus, args.documents, args.pages, args.kinds)
+        results = asyncio.run(run_levels(args, paths))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"❌ Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
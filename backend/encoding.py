@@ -0,0 +1,164 @@
+import io
+from dataclasses import dataclass
+from typing import Dict
+
+from PIL import Image, ImageChops, ImageStat
+
+# Analysis runs on a thumbnail, which is plenty to classify a page and cheap to compute
+ANALYSIS_SIZE = (256, 256)
+
+# Grey levels at or above this count as paper, below it as ink
+PAPER_LEVEL = 230
+
+
+@dataclass(frozen=True)
+class EncodingProfile:
+    """
+    How rendered pages are turned into the image sent to the model.
+
+    `adaptive` profiles pick grayscale vs colour, lossless vs lossy and the resolution per
+    page from its content; otherwise every page is sent as RGB PNG, like pyzerox does.
+    """
+
+    name: str
+    adaptive: bool = True
+    skip_blank: bool = True
+    # A page counts as blank only with at most this many ink pixels at render resolution.
+    # A single printed character has several times as many, so anything legible is kept.
+    blank_max_ink_pixels: int = 16
+    # Mean per-pixel channel spread above which colour is kept
+    colour_threshold: float = 12.0
+    # Share of mid-tone pixels above which a page is treated as a photo or scan
+    photo_midtone_ratio: float = 0.25
+    lossy_format: str = "JPEG"
+    lossy_quality: int = 80
+    # Text is encoded lossily at a higher quality, and only when that is this much smaller than PNG
+    text_lossy_quality: int = 90
+    lossy_text_gain: float = 0.7
+    max_long_side: int = 1056
+    photo_max_long_side: int = 768
+
+
+PROFILES: Dict[str, EncodingProfile] = {
+    "png": EncodingProfile(name="png", adaptive=False, skip_blank=False),
+    "adaptive": EncodingProfile(name="adaptive"),
+    "compact": EncodingProfile(
+        name="compact",
+        lossy_format="WEBP",
+        lossy_quality=70,
+        text_lossy_quality=85,
+        lossy_text_gain=0.9,
+        photo_max_long_side=640,
+    ),
+}
+
+MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+@dataclass
+class PageAnalysis:
+    """Cheap content statistics of a rendered page."""
+
+    ink_ratio: float
+    midtone_ratio: float
+    colourfulness: float
+
+
+@dataclass
+class EncodedPage:
+    """A page image ready to send, or a blank page that needs no model call."""
+
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    grayscale: bool
+    blank: bool = False
+
+
+def get_profile(name: str) -> EncodingProfile:
+    if name not in PROFILES:
+        raise ValueError(f"Unknown encoding profile {name!r}, expected one of {sorted(PROFILES)}")
+    return PROFILES[name]
+
+
+def analyze_page(image: Image.Image) -> PageAnalysis:
+    thumbnail = image.convert("RGB")
+    thumbnail.thumbnail(ANALYSIS_SIZE)
+
+    gray = thumbnail.convert("L")
+    histogram = gray.histogram()
+    pixels = sum(histogram) or 1
+    ink = sum(histogram[:PAPER_LEVEL])
+    midtones = sum(histogram[40:200])
+
+    # Largest difference between any two channels, averaged over the page
+    r, g, b = thumbnail.split()
+    spread = ImageChops.lighter(ImageChops.lighter(
+        ImageChops.difference(r, g), ImageChops.difference(g, b)), ImageChops.difference(r, b))
+
+    return PageAnalysis(
+        ink_ratio=ink / pixels,
+        midtone_ratio=midtones / pixels,
+        colourfulness=ImageStat.Stat(spread).mean[0],
+    )
+
+
+def count_ink_pixels(image: Image.Image) -> int:
+    """Ink pixels of the page at full resolution, where even a single short line is hundreds of pixels."""
+    return sum(image.convert("L").histogram()[:PAPER_LEVEL])
+
+
+def is_blank(image: Image.Image, analysis: PageAnalysis, profile: EncodingProfile) -> bool:
+    # The thumbnail rules out most pages cheaply; downscaling averages thin strokes into
+    # paper, so it can't prove a page is empty on its own
+    if analysis.ink_ratio > 0.01:
+        return False
+    return count_ink_pixels(image) <= profile.blank_max_ink_pixels
+
+
+def _save(image: Image.Image, fmt: str, quality: int) -> bytes:
+    with io.BytesIO() as buffer:
+        if fmt == "PNG":
+            image.save(buffer, format="PNG", optimize=True)
+        else:
+            image.save(buffer, format=fmt, quality=quality)
+        return buffer.getvalue()
+
+
+def _fit(image: Image.Image, max_long_side: int) -> Image.Image:
+    scale = max_long_side / max(image.size)
+    if scale >= 1:
+        return image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.LANCZOS)
+
+
+def encode_page(image: Image.Image, profile: EncodingProfile) -> EncodedPage:
+    """Choose a format, colour mode and size for one page and encode it in memory."""
+    if not profile.adaptive:
+        image = _fit(image.convert("RGB"), profile.max_long_side)
+        data = _save(image, "PNG", 0)
+        return EncodedPage(data, MIME_TYPES["PNG"], image.width, image.height, grayscale=False)
+
+    analysis = analyze_page(image)
+    if profile.skip_blank and is_blank(image, analysis, profile):
+        return EncodedPage(b"", "", image.width, image.height, grayscale=True, blank=True)
+
+    grayscale = analysis.colourfulness < profile.colour_threshold
+    image = image.convert("L" if grayscale else "RGB")
+
+    if analysis.midtone_ratio >= profile.photo_midtone_ratio:
+        # Photos and noisy scans compress badly losslessly and need less resolution
+        image = _fit(image, profile.photo_max_long_side)
+        fmt = profile.lossy_format
+        data = _save(image, fmt, profile.lossy_quality)
+    else:
+        # Text: keep it lossless unless lossy is clearly smaller
+        image = _fit(image, profile.max_long_side)
+        fmt, data = "PNG", _save(image, "PNG", 0)
+        lossy = _save(image, profile.lossy_format, profile.text_lossy_quality)
+        if len(lossy) < len(data) * profile.lossy_text_gain:
+            fmt, data = profile.lossy_format, lossy
+
+    return EncodedPage(data, MIME_TYPES[fmt], image.width, image.height, grayscale=grayscale)
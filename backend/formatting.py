@@ -0,0 +1,114 @@
+import re
+from dataclasses import dataclass
+from typing import FrozenSet, List
+
+# Longest format anchor passed to the model alongside every page
+FORMAT_ANCHOR_CHARS = 2000
+
+# Table rows kept in the anchor: header, separator and one body row
+ANCHOR_TABLE_ROWS = 3
+ANCHOR_LIST_ITEMS = 2
+
+HEADING = re.compile(r"^(#{1,6})\s+\S")
+LIST_ITEM = re.compile(r"^\s*([-*+]|\d{1,3}[.)])\s+\S")
+TABLE_ROW = re.compile(r"^\s*\|")
+
+
+@dataclass(frozen=True)
+class Structure:
+    """The parts of a page's markdown that should look the same from page to page."""
+
+    heading_levels: FrozenSet[int]
+    # Column counts of a table at the very start or end of the page, 0 if there is none
+    leading_table_columns: int
+    trailing_table_columns: int
+
+
+def _columns(row: str) -> int:
+    return len(row.strip().strip("|").split("|"))
+
+
+def analyze_structure(markdown: str) -> Structure:
+    lines = [line for line in markdown.splitlines() if line.strip()]
+    heading_levels = frozenset(len(match.group(1)) for line in lines if (match := HEADING.match(line)))
+    return Structure(
+        heading_levels=heading_levels,
+        leading_table_columns=_columns(lines[0]) if lines and TABLE_ROW.match(lines[0]) else 0,
+        trailing_table_columns=_columns(lines[-1]) if lines and TABLE_ROW.match(lines[-1]) else 0,
+    )
+
+
+def build_anchor(markdown: str, max_chars: int = FORMAT_ANCHOR_CHARS) -> str:
+    """
+    Condense a page into a formatting example for the pages that follow.
+
+    Keeps every heading, the first lines of each table and list and the first line of
+    each paragraph, so the model sees how the document is structured without paying
+    for the whole page on every call.
+    """
+    excerpt: List[str] = []
+    length = 0
+    table_rows = list_items = 0
+    in_paragraph = False
+
+    for line in markdown.splitlines():
+        if not line.strip():
+            table_rows = list_items = 0
+            in_paragraph = False
+            keep = bool(excerpt) and excerpt[-1] != ""
+        elif HEADING.match(line):
+            keep = True
+        elif TABLE_ROW.match(line):
+            table_rows += 1
+            keep = table_rows <= ANCHOR_TABLE_ROWS
+        elif LIST_ITEM.match(line):
+            list_items += 1
+            keep = list_items <= ANCHOR_LIST_ITEMS
+        else:
+            keep = not in_paragraph
+            in_paragraph = True
+
+        if not keep:
+            continue
+        if length + len(line) + 1 > max_chars:
+            break
+        excerpt.append(line)
+        length += len(line) + 1
+
+    return "\n".join(excerpt).strip()
+
+
+def can_conflict(page: str) -> bool:
+    """Whether conflicts() could ever flag this page, i.e. it has headings or starts with a table."""
+    structure = analyze_structure(page)
+    return bool(structure.heading_levels or structure.leading_table_columns)
+
+
+def conflicts(page: str, previous: str, anchor: str) -> bool:
+    """
+    Whether a page produced against the anchor disagrees with the page before it.
+
+    Flags a table continued from the previous page with a different number of columns,
+    and headings that skip past the levels seen in the anchor or the previous page, e.g.
+    a #### under a document that only used # and ##. Nesting one level deeper than a
+    known level, or starting a new top level, is normal and not flagged.
+    """
+    if not page or not previous:
+        return False
+
+    current = analyze_structure(page)
+    before = analyze_structure(previous)
+
+    if before.trailing_table_columns and current.leading_table_columns \
+            and before.trailing_table_columns != current.leading_table_columns:
+        return True
+
+    known_levels = before.heading_levels | analyze_structure(anchor).heading_levels
+    if not known_levels:
+        return False
+    reachable = set(known_levels)
+    for level in sorted(current.heading_levels):
+        if level not in reachable and level - 1 not in reachable and level > min(known_levels):
+            return True
+        reachable.add(level)
+    return False
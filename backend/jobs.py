@@ -0,0 +1,324 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from time import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from pyzerox.models.base import BaseModel
+
+from ocr import stream_pages
+from rasterize import count_pages
+from scheduler import is_transient_error
+
+logger = logging.getLogger("supaocr.jobs")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    file_size INTEGER NOT NULL DEFAULT 0,
+    total_pages INTEGER,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    job_id TEXT NOT NULL REFERENCES jobs(id),
+    page INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    cached INTEGER NOT NULL DEFAULT 0,
+    route TEXT NOT NULL DEFAULT 'model',
+    PRIMARY KEY (job_id, page)
+);
+"""
+
+# Columns added after the first release, applied to existing databases on open
+MIGRATIONS = {
+    "jobs": {"attempts": "INTEGER NOT NULL DEFAULT 0"},
+    "pages": {"route": "TEXT NOT NULL DEFAULT 'model'"},
+}
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class IncompleteJob(Exception):
+    """A run finished with pages that failed, usually because the provider had problems."""
+
+
+class JobStore:
+    """
+    SQLite persistence for jobs and their per-page results.
+
+    Methods are blocking; call them through asyncio.to_thread from async code.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            for table, columns in MIGRATIONS.items():
+                existing = {row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+                for name, definition in columns.items():
+                    if name not in existing:
+                        self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+    def create(self, file_path: str, file_name: str, file_size: int) -> str:
+        job_id = uuid.uuid4().hex
+        now = time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, file_path, file_name, file_size, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, file_path, file_name, file_size, now, now),
+            )
+        return job_id
+
+    def update(self, job_id: str, **fields) -> None:
+        fields["updated_at"] = time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def save_page(
+        self, job_id: str, page: int, content: str, input_tokens: int, output_tokens: int, cached: bool, route: str
+    ) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (job_id, page, content, input_tokens, output_tokens, cached, route)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, page, content, input_tokens, output_tokens, int(cached), route),
+            )
+            self._conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time(), job_id))
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def pages(self, job_id: str) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page, content, input_tokens, output_tokens, cached, route FROM pages"
+                " WHERE job_id = ? ORDER BY page",
+                (job_id,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def completed_pages(self, job_id: str) -> List[int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT page FROM pages WHERE job_id = ?", (job_id,)).fetchall()
+        return [row["page"] for row in rows]
+
+    def unfinished(self) -> List[str]:
+        """Jobs that were queued or interrupted mid-run, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at", (QUEUED, RUNNING)
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+
+class JobManager:
+    """
+    Runs OCR jobs on a fixed pool of background workers.
+
+    Finished pages are persisted as they arrive. After a crash or restart, unfinished
+    jobs are re-queued on start() and only their missing pages are processed again.
+
+    A run that hits a transient error (rate limit, timeout, 5xx) or leaves pages failed
+    is retried with exponential backoff, up to `max_attempts` runs in total. Jobs that
+    fail for good have their upload removed, like completed ones.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        get_model: Callable[[], Awaitable[BaseModel]],
+        workers: int = 2,
+        concurrency: int = 10,
+        options: Optional[Dict[str, Any]] = None,
+        max_attempts: int = 3,
+        retry_base_delay: float = 30.0,
+        retry_max_delay: float = 600.0,
+    ):
+        """
+        :param get_model: Returns the model instance to run jobs with
+        :param options: Extra keyword arguments for ocr.stream_pages, e.g. cache and scheduler
+        :param max_attempts: Runs per job before transient failures and failed pages are final
+        :param retry_base_delay: Seconds before the first retry, doubled for each later one
+        """
+        self.store = store
+        self.get_model = get_model
+        self.workers = workers
+        self.concurrency = concurrency
+        self.options = options or {}
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._retries: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        for job_id in await asyncio.to_thread(self.store.unfinished):
+            logger.info(f"Resuming job {job_id}")
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        # Interrupted jobs stay "running" and jobs waiting to retry stay "queued" in the
+        # store, and both are resumed on the next start()
+        tasks = self._tasks + list(self._retries)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._retries.clear()
+
+    async def submit(self, file_path: str, file_name: str, file_size: int) -> str:
+        """Record a job for an upload the manager now owns, and queue it."""
+        job_id = await asyncio.to_thread(self.store.create, file_path, file_name, file_size)
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                await self._fail(job_id, error)
+            finally:
+                self._queue.task_done()
+
+    async def _fail(self, job_id: str, error: Exception) -> None:
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if (is_transient_error(error) or isinstance(error, IncompleteJob)) and job["attempts"] < self.max_attempts:
+            delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** max(0, job["attempts"] - 1))
+            logger.warning(f"Job {job_id} attempt {job['attempts']} failed, retrying in {delay:.0f}s: {error}")
+            await asyncio.to_thread(self.store.update, job_id, status=QUEUED, error=str(error))
+            task = asyncio.create_task(self._retry_later(job_id, delay))
+            self._retries.add(task)
+            task.add_done_callback(self._retries.discard)
+            return
+
+        logger.error(f"Job {job_id} failed: {error}")
+        await asyncio.to_thread(self.store.update, job_id, status=FAILED, error=str(error))
+        _remove(job["file_path"])
+
+    async def _retry_later(self, job_id: str, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._queue.put_nowait(job_id)
+
+    async def _run(self, job_id: str) -> None:
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or job["status"] in (COMPLETED, FAILED):
+            return
+
+        attempts = job["attempts"] + 1
+        await asyncio.to_thread(self.store.update, job_id, status=RUNNING, attempts=attempts)
+        total_pages = job["total_pages"] or await count_pages(job["file_path"])
+        await asyncio.to_thread(self.store.update, job_id, total_pages=total_pages)
+
+        done = set(await asyncio.to_thread(self.store.completed_pages, job_id))
+        remaining = [page for page in range(1, total_pages + 1) if page not in done]
+        if done:
+            logger.info(f"Job {job_id}: {len(done)} pages already done, {len(remaining)} to go")
+
+        if remaining:
+            saved = 0
+            async for page in stream_pages(
+                file_path=job["file_path"],
+                model=await self.get_model(),
+                concurrency=self.concurrency,
+                # Only resumes select pages, which would otherwise warn with maintain_format on every job
+                select_pages=remaining if done else None,
+                **self.options,
+            ):
+                # Failed pages are not stored, so a later resume retries them. Blank pages
+                # are stored empty so they count as done.
+                if page.content or page.blank:
+                    await asyncio.to_thread(
+                        self.store.save_page, job_id, page.page, page.content,
+                        page.input_tokens, page.output_tokens, page.cached, page.route,
+                    )
+                    saved += 1
+
+            failed = len(remaining) - saved
+            if failed and attempts < self.max_attempts:
+                raise IncompleteJob(f"{failed} pages failed")
+
+        # Pages still missing on the last attempt are reported as failed_pages
+        await asyncio.to_thread(self.store.update, job_id, status=COMPLETED, error=None)
+        _remove(job["file_path"])
+
+    async def describe(self, job_id: str) -> Optional[dict]:
+        """Job status, progress and every page finished so far."""
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None:
+            return None
+        pages = await asyncio.to_thread(self.store.pages, job_id)
+
+        total_pages = job["total_pages"]
+        finished = {page["page"] for page in pages}
+        blank_pages = [page["page"] for page in pages if not page["content"]]
+        pages = [page for page in pages if page["content"]]
+        return {
+            "job_id": job_id,
+            "status": job["status"],
+            "file_name": job["file_name"],
+            "error": job["error"],
+            "attempts": job["attempts"],
+            "total_pages": total_pages,
+            "completed_pages": len(finished),
+            "progress": len(finished) / total_pages if total_pages else 0.0,
+            "failed_pages": (
+                [page for page in range(1, total_pages + 1) if page not in finished]
+                if job["status"] == COMPLETED else []
+            ),
+            "blank_pages": blank_pages,
+            "pages": [{
+                "content": page["content"],
+                "page_number": page["page"],
+                "input_tokens": page["input_tokens"],
+                "output_tokens": page["output_tokens"],
+                "cached": bool(page["cached"]),
+                "route": page["route"]
+            } for page in pages],
+            "stats": {
+                "file_size": job["file_size"],
+                "input_tokens": sum(page["input_tokens"] for page in pages),
+                "output_tokens": sum(page["output_tokens"] for page in pages),
+                "created_at": job["created_at"],
+                "updated_at": job["updated_at"],
+            },
+        }
+
+
+def _remove(file_path: str) -> None:
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
@@ -1,6 +1,11 @@
-from fastapi import FastAPI, UploadFile, File, Response, status
+from fastapi import FastAPI, UploadFile, File, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from pyzerox import zerox
+from ocr import build_output, stream_pages, zerox
+from page_cache import PageCache
+from scheduler import ModelScheduler
+from model_registry import ModelRegistry
+from jobs import JobManager, JobStore
+from metrics import metrics
 import os
 from dotenv import load_dotenv
 import datetime
@@ -8,9 +13,12 @@ import logging
 from fastapi import HTTPException
 import sys
 import traceback
-from fastapi.responses import JSONResponse
+import asyncio
+import tempfile
+from fastapi.responses import JSONResponse, StreamingResponse
+import json
 from litellm import litellm
-from time import time
+from time import perf_counter, time
 
 load_dotenv()
 
@@ -41,8 +49,77 @@ os.environ["LITELLM_MODEL_CONFIG"] = """{
 
 print(f"🔑 [Init] Using model: gpt-4o-mini")
 
+# Page results are shared across requests so repeat uploads skip the vision model
+page_cache = PageCache.from_env()
+print(f"🗄️ [Init] Page cache: {page_cache.max_memory_entries} in memory, disk at {page_cache.disk_dir or 'disabled'}")
+
+# One scheduler for every in-flight request keeps us under the provider's limits
+model_scheduler = ModelScheduler.from_env()
+print(f"🚦 [Init] Model scheduler: {model_scheduler.max_concurrency} concurrent, {model_scheduler.requests_per_minute} RPM, {model_scheduler.tokens_per_minute} TPM")
+
+# How page images are encoded before they are sent; see encoding.PROFILES
+ENCODING_PROFILE = os.getenv('ENCODING_PROFILE', 'adaptive')
+print(f"🖼️ [Init] Page encoding profile: {ENCODING_PROFILE}")
+
+# Born-digital pages with a clean text layer can skip the vision model. Off unless set,
+# e.g. to 0.8, until it has been validated on your documents
+TEXT_LAYER_MIN_QUALITY = os.getenv('TEXT_LAYER_MIN_QUALITY', '')
+print(f"📝 [Init] Text layer fast path: {'min quality ' + TEXT_LAYER_MIN_QUALITY if TEXT_LAYER_MIN_QUALITY else 'disabled'}")
+
+# Keep markdown formatting consistent across pages; "anchored" runs pages in parallel, see ocr.FORMAT_MODES
+MAINTAIN_FORMAT = os.getenv('MAINTAIN_FORMAT', 'false').lower() in ('1', 'true', 'yes')
+FORMAT_MODE = os.getenv('FORMAT_MODE', 'anchored')
+print(f"🧩 [Init] Maintain format: {FORMAT_MODE if MAINTAIN_FORMAT else 'off'}")
+
+# Shared by every OCR entry point: /convert, /convert/stream, /process and background jobs
+OCR_OPTIONS = {
+    "cache": page_cache,
+    "scheduler": model_scheduler,
+    "encoding_profile": ENCODING_PROFILE,
+    "text_layer_min_quality": float(TEXT_LAYER_MIN_QUALITY) if TEXT_LAYER_MIN_QUALITY else None,
+    "maintain_format": MAINTAIN_FORMAT,
+    "format_mode": FORMAT_MODE,
+}
+
+# Models are built and validated once, not on every request
+model_registry = ModelRegistry.from_env(scheduler=model_scheduler)
+
+# Background jobs survive restarts: uploads and page results live under JOBS_DIR
+JOBS_DIR = os.getenv('JOBS_DIR', '/tmp/supaocr-jobs')
+os.makedirs(JOBS_DIR, exist_ok=True)
+job_manager = JobManager(
+    JobStore(os.path.join(JOBS_DIR, 'jobs.sqlite3')),
+    get_model=lambda: model_registry.get("gpt-4o-mini"),
+    workers=int(os.getenv('JOB_WORKERS', '2')),
+    options=OCR_OPTIONS,
+    max_attempts=int(os.getenv('JOB_MAX_ATTEMPTS', '3')),
+)
+print(f"📋 [Init] Job store at {JOBS_DIR} with {job_manager.workers} workers")
+
 app = FastAPI()
 
+# Held so the warm-up task isn't garbage collected while it runs
+warm_task = None
+
+def log_warm_failure(task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"❌ Model warm-up failed: {task.exception()}")
+
+@app.on_event("startup")
+async def warm_models():
+    global warm_task
+    # Validate in the background so a slow provider doesn't hold up boot or health checks
+    warm_task = asyncio.create_task(model_registry.warm(["gpt-4o-mini"]))
+    warm_task.add_done_callback(log_warm_failure)
+
+@app.on_event("startup")
+async def start_jobs():
+    await job_manager.start()
+
+@app.on_event("shutdown")
+async def stop_jobs():
+    await job_manager.stop()
+
 # Get the frontend URL from environment
 FRONTEND_URL = os.getenv('FRONTEND_URL', 'https://your-vercel-app.vercel.app')
 
@@ -58,8 +135,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = perf_counter()
+    response = await call_next(request)
+    # Label by route template, not the raw path, so job ids don't explode the series
+    route = request.scope.get("route")
+    endpoint = getattr(route, "path", "unmatched")
+    metrics.observe("supaocr_request_seconds", perf_counter() - start, endpoint=endpoint)
+    metrics.inc("supaocr_requests_total", endpoint=endpoint, status=str(response.status_code))
+    return response
+
 logger = logging.getLogger("supaocr")
-logger.setLevel(logging.DEBUG)
+# Per-page logging adds up under load; raise LOG_LEVEL to WARNING to quiet it
+logger.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
 handler = logging.StreamHandler(sys.stdout)
 handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
 logger.addHandler(handler)
@@ -70,6 +159,46 @@ print("OPENAI_API_KEY:", "✓ Set" if openai_key else "✗ Missing")
 print("FRONTEND_URL:", os.getenv('FRONTEND_URL', '✗ Missing'))
 print("PORT:", os.getenv('PORT', '✗ Missing'))
 
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+async def save_upload(file: UploadFile, directory: str = None) -> tuple:
+    """
+    Spool an upload to a unique path in chunks, without holding it all in memory.
+    Uses the system temp dir unless `directory` is given.
+    Returns (path, size). The caller owns the file and must remove it.
+    """
+    suffix = os.path.splitext(file.filename or "")[1] or ".pdf"
+    fd, file_path = tempfile.mkstemp(prefix="supaocr-", suffix=suffix, dir=directory)
+
+    def copy() -> int:
+        read_seconds = write_seconds = 0.0
+        with os.fdopen(fd, "wb") as dst:
+            while True:
+                start = perf_counter()
+                chunk = file.file.read(UPLOAD_CHUNK_BYTES)
+                read_seconds += perf_counter() - start
+                if not chunk:
+                    break
+                start = perf_counter()
+                dst.write(chunk)
+                write_seconds += perf_counter() - start
+            size = dst.tell()
+        metrics.observe_stage("upload_read", read_seconds)
+        metrics.observe_stage("file_copy", write_seconds)
+        return size
+
+    try:
+        return file_path, await asyncio.to_thread(copy)
+    except Exception:
+        os.remove(file_path)
+        raise
+
+def remove_upload(file_path: str) -> None:
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
+
 @app.post("/convert")
 async def convert_document(file: UploadFile = File(...)):
     start_time = time()
@@ -91,25 +220,13 @@ async def convert_document(file: UploadFile = File(...)):
         logger.info(f"  - /tmp directory exists: {os.path.exists('/tmp')}")
         logger.info(f"  - /tmp directory writable: {os.access('/tmp', os.W_OK)}")
         
-        # Save file with more detailed logging
-        file_path = f"/tmp/{file.filename}"
+        # Spool upload to a unique path so concurrent uploads never collide
         try:
-            content = await file.read()
-            logger.info(f"📄 Read file content:")
-            logger.info(f"  - Content size: {len(content)} bytes")
-            logger.info(f"  - Content type: {type(content)}")
-            
-            with open(file_path, "wb") as f:
-                f.write(content)
-                
-            if os.path.exists(file_path):
-                file_size = os.path.getsize(file_path)
-                logger.info(f"✅ File saved successfully:")
-                logger.info(f"  - Path: {file_path}")
-                logger.info(f"  - Size: {file_size/1024:.1f} KB")
-            else:
-                logger.error("❌ File not saved properly")
-                
+            file_path, file_size = await save_upload(file)
+            logger.info(f"✅ File saved successfully:")
+            logger.info(f"  - Path: {file_path}")
+            logger.info(f"  - Size: {file_size/1024:.1f} KB")
+
         except Exception as file_error:
             logger.error(f"❌ File handling error: {str(file_error)}")
             logger.error(traceback.format_exc())
@@ -129,32 +246,52 @@ async def convert_document(file: UploadFile = File(...)):
             logger.info(f"🚀 Starting zerox at: {time() - start_time:.2f}s elapsed")
             result = await zerox(
                 file_path=file_path,
-                model="gpt-4o-mini",
+                model=await model_registry.get("gpt-4o-mini"),
                 cleanup=True,
+                **OCR_OPTIONS,
             )
             logger.info(f"✅ Zerox completed at: {time() - start_time:.2f}s elapsed")
+            logger.info(f"🗄️ Cache: {result.cache_hits} hits, {result.cache_misses} misses")
+            logger.info(f"🖼️ Images: {result.image_bytes/1024:.1f} KB sent, {result.blank_pages} blank pages skipped")
+            logger.info(f"📝 Text layer: {result.text_pages} pages converted locally")
+            if MAINTAIN_FORMAT:
+                logger.info(f"🧩 Format: {result.reformatted_pages} pages re-run for consistency")
             
         except Exception as zerox_error:
             logger.error(f"❌ Zerox error at {time() - start_time:.2f}s: {str(zerox_error)}")
             logger.error(f"Zerox error type: {type(zerox_error)}")
             logger.error(traceback.format_exc())
             raise
+        finally:
+            remove_upload(file_path)
 
-        return JSONResponse(
+        serialize_start = perf_counter()
+        response = JSONResponse(
             status_code=200,
             content={
                 "pages": [{
                     "content": page.content,
-                    "page_number": idx + 1
-                } for idx, page in enumerate(result.pages)],
+                    "page_number": page.page,
+                    "route": page.route
+                } for page in result.pages],
                 "request_id": request_id,
                 "stats": {
                     "file_size": file_size,
                     "total_pages": len(result.pages),
-                    "total_chars": sum(len(page.content) for page in result.pages)
+                    "total_chars": sum(len(page.content) for page in result.pages),
+                    "input_tokens": result.input_tokens,
+                    "output_tokens": result.output_tokens,
+                    "cache_hits": result.cache_hits,
+                    "cache_misses": result.cache_misses,
+                    "blank_pages": result.blank_pages,
+                    "text_pages": result.text_pages,
+                    "image_bytes": result.image_bytes,
+                    "reformatted_pages": result.reformatted_pages
                 }
             }
         )
+        metrics.observe_stage("serialization", perf_counter() - serialize_start)
+        return response
 
     except Exception as e:
         logger.error(f"❌ General error: {str(e)}")
@@ -164,6 +301,108 @@ async def convert_document(file: UploadFile = File(...)):
             detail={"error": str(e), "request_id": request_id}
         )
 
+@app.post("/convert/stream")
+async def convert_document_stream(file: UploadFile = File(...)):
+    """
+    Same as /convert, but streams NDJSON: one "page" record per page as soon as it
+    finishes (in completion order), then a final "stats" record.
+    """
+    request_id = datetime.datetime.now().isoformat()
+    logger.info(f"=== Starting Streaming Conversion (Request ID: {request_id}) ===")
+
+    try:
+        file_path, file_size = await save_upload(file)
+    except Exception as file_error:
+        logger.error(f"❌ File handling error: {str(file_error)}")
+        raise HTTPException(
+            status_code=500,
+            detail={"error": "File handling failed", "details": str(file_error)}
+        )
+
+    async def records():
+        start_time = datetime.datetime.now()
+        pages = []
+        try:
+            async for page in stream_pages(
+                file_path=file_path,
+                model=await model_registry.get("gpt-4o-mini"),
+                cleanup=True,
+                **OCR_OPTIONS,
+            ):
+                pages.append(page)
+                logger.info(f"📄 Page {page.page} done at {(datetime.datetime.now() - start_time).total_seconds():.2f}s")
+                with metrics.span("serialization"):
+                    record = json.dumps({
+                        "type": "page",
+                        "page_number": page.page,
+                        "content": page.content,
+                        "input_tokens": page.input_tokens,
+                        "output_tokens": page.output_tokens,
+                        "cached": page.cached,
+                        "blank": page.blank,
+                        "image_bytes": page.image_bytes,
+                        "image_format": page.image_format,
+                        "route": page.route,
+                        "reformatted": page.reformatted
+                    }) + "\n"
+                yield record
+
+            result = build_output(file_path, pages, start_time, page_cache)
+            yield json.dumps({
+                "type": "stats",
+                "request_id": request_id,
+                "stats": {
+                    "file_size": file_size,
+                    "total_pages": len(result.pages),
+                    "total_chars": sum(len(page.content) for page in result.pages),
+                    "input_tokens": result.input_tokens,
+                    "output_tokens": result.output_tokens,
+                    "cache_hits": result.cache_hits,
+                    "cache_misses": result.cache_misses,
+                    "blank_pages": result.blank_pages,
+                    "text_pages": result.text_pages,
+                    "image_bytes": result.image_bytes,
+                    "reformatted_pages": result.reformatted_pages,
+                    "completion_time": result.completion_time
+                }
+            }) + "\n"
+
+        except Exception as e:
+            # Headers are already sent, so errors have to travel in-band
+            metrics.inc("supaocr_stream_errors_total")
+            logger.error(f"❌ Streaming error: {str(e)}")
+            logger.error(traceback.format_exc())
+            yield json.dumps({"type": "error", "error": str(e), "request_id": request_id}) + "\n"
+
+        finally:
+            remove_upload(file_path)
+
+    return StreamingResponse(records(), media_type="application/x-ndjson")
+
+@app.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def create_job(file: UploadFile = File(...)):
+    """Queue a document for background OCR and return its job id right away."""
+    try:
+        file_path, file_size = await save_upload(file, directory=JOBS_DIR)
+    except Exception as file_error:
+        logger.error(f"❌ File handling error: {str(file_error)}")
+        raise HTTPException(
+            status_code=500,
+            detail={"error": "File handling failed", "details": str(file_error)}
+        )
+
+    job_id = await job_manager.submit(file_path, file.filename or "", file_size)
+    logger.info(f"📋 Queued job {job_id} for {file.filename} ({job_manager.queue_depth} waiting)")
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Job status and progress, with every page finished so far."""
+    job = await job_manager.describe(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail={"error": "Job not found", "job_id": job_id})
+    return job
+
 @app.get("/")
 async def root():
     return {"status": "ok"}
@@ -179,6 +418,44 @@ async def health():
         }
     }
 
+@app.get("/cache/stats")
+async def cache_stats():
+    return page_cache.stats()
+
+@app.get("/scheduler/stats")
+async def scheduler_stats():
+    return model_scheduler.stats()
+
+@app.get("/models/stats")
+async def model_stats():
+    return model_registry.stats()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Stage timings, request and model counters, and cache, scheduler, model and job state."""
+    cache = page_cache.stats()
+    metrics.set("supaocr_cache_hits_total", cache["hits"])
+    metrics.set("supaocr_cache_misses_total", cache["misses"])
+    metrics.set("supaocr_cache_saved_tokens_total", cache["saved_input_tokens"], direction="input")
+    metrics.set("supaocr_cache_saved_tokens_total", cache["saved_output_tokens"], direction="output")
+    metrics.set("supaocr_cache_entries", cache["memory_entries"], tier="memory")
+    metrics.set("supaocr_cache_entries", cache["disk_entries"], tier="disk")
+    metrics.set("supaocr_cache_disk_bytes", cache["disk_bytes"])
+
+    scheduler = model_scheduler.stats()
+    for name in ("active", "queue_depth", "window_tokens"):
+        metrics.set(f"supaocr_scheduler_{name}", scheduler[name])
+    for name in ("requests", "rate_limited", "retries", "failures"):
+        metrics.set(f"supaocr_scheduler_{name}_total", scheduler[name])
+
+    models = model_registry.stats()
+    metrics.set("supaocr_model_validations_total", models["validations_run"])
+    for model, validation in models["models"].items():
+        metrics.set("supaocr_model_valid", int(validation["valid"]), model=model)
+
+    metrics.set("supaocr_job_queue_depth", job_manager.queue_depth)
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/process")
 async def process_file(file: UploadFile):
     try:
@@ -186,20 +463,20 @@ async def process_file(file: UploadFile):
         logger.debug(f"File content type: {file.content_type}")
         
         # Save file temporarily
-        file_path = f"/tmp/{file.filename}"
-        content = await file.read()
-        logger.debug(f"File size: {len(content)} bytes")
-        
-        with open(file_path, "wb") as f:
-            f.write(content)
+        file_path, file_size = await save_upload(file)
+        logger.debug(f"File size: {file_size} bytes")
             
         # Process with zerox
         logger.info("Starting zerox processing")
-        result = await zerox(
-            file_path=file_path,
-            model="gpt-4o-mini",
-            cleanup=True
-        )
+        try:
+            result = await zerox(
+                file_path=file_path,
+                model=await model_registry.get("gpt-4o-mini"),
+                cleanup=True,
+                **OCR_OPTIONS
+            )
+        finally:
+            remove_upload(file_path)
         logger.info("Zerox processing complete")
         
         return {"markdown": "\n\n".join(page.content for page in result.pages)}
@@ -244,4 +521,5 @@ async def test_openai():
             "key_prefix": openai_key[:8] if openai_key else None
         }
 
-litellm.set_verbose = True
+# LiteLLM's verbose mode prints every request and response; only turn it on to debug
+litellm.set_verbose = os.getenv('LITELLM_VERBOSE', 'false').lower() in ('1', 'true', 'yes')
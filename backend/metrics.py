@@ -0,0 +1,151 @@
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Dict, Iterator, List, Tuple
+
+# Upper bounds, in seconds, of the stage, request and scheduler wait histograms
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Name -> (type, help) for everything exported on /metrics
+METRICS: Dict[str, Tuple[str, str]] = {
+    "supaocr_stage_seconds": ("histogram", "Time spent per pipeline stage and item"),
+    "supaocr_request_seconds": ("histogram", "Time to response headers per endpoint"),
+    "supaocr_requests_total": ("counter", "HTTP requests by endpoint and status code"),
+    "supaocr_stream_errors_total": ("counter", "Streaming conversions that failed after headers were sent"),
+    "supaocr_pages_total": ("counter", "Pages produced, by route"),
+    "supaocr_model_calls_total": ("counter", "Vision model calls, by outcome"),
+    "supaocr_tokens_total": ("counter", "Model tokens spent, by direction"),
+    "supaocr_cache_hits_total": ("counter", "Page cache hits since start"),
+    "supaocr_cache_misses_total": ("counter", "Page cache misses since start"),
+    "supaocr_cache_saved_tokens_total": ("counter", "Model tokens saved by page cache hits"),
+    "supaocr_cache_entries": ("gauge", "Page cache entries, by tier"),
+    "supaocr_cache_disk_bytes": ("gauge", "Size of the page cache disk tier"),
+    "supaocr_scheduler_active": ("gauge", "Model calls currently admitted by the scheduler"),
+    "supaocr_scheduler_queue_depth": ("gauge", "Model calls waiting for a scheduler slot"),
+    "supaocr_scheduler_wait_seconds": ("histogram", "Time model calls waited for a scheduler slot"),
+    "supaocr_scheduler_requests_total": ("counter", "Model requests admitted by the scheduler"),
+    "supaocr_scheduler_rate_limited_total": ("counter", "Model requests that hit a provider rate limit"),
+    "supaocr_scheduler_retries_total": ("counter", "Model requests retried after a rate limit"),
+    "supaocr_scheduler_failures_total": ("counter", "Model requests that failed for good"),
+    "supaocr_scheduler_window_tokens": ("gauge", "Tokens spent in the current rate limit window"),
+    "supaocr_model_validations_total": ("counter", "Model validations run by the registry"),
+    "supaocr_model_valid": ("gauge", "Whether a model has ever validated, and so is being served"),
+    "supaocr_job_queue_depth": ("gauge", "Background jobs waiting for a worker"),
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    """
+    Process-wide counters, gauges and duration histograms, exported in the Prometheus
+    text format.
+
+    Safe to record from worker threads (asyncio.to_thread), which is where rasterizing,
+    encoding and text extraction run.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._values: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(self.buckets)
+            series[key].observe(value)
+
+    def observe_stage(self, stage: str, seconds: float) -> None:
+        self.observe("supaocr_stage_seconds", seconds, stage=stage)
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """Time the enclosed block as one observation of `stage`, whether or not it raises."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, perf_counter() - start)
+
+    def stage_totals(self) -> Dict[str, Tuple[int, float]]:
+        """Observation count and total seconds per stage."""
+        with self._lock:
+            series = self._histograms.get("supaocr_stage_seconds", {})
+            return {dict(key)["stage"]: (histogram.count, histogram.sum) for key, histogram in series.items()}
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        def header(name: str) -> None:
+            kind, help_text = METRICS.get(name, ("untyped", ""))
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for name in sorted(self._values):
+                header(name)
+                for key, value in sorted(self._values[name].items()):
+                    lines.append(f"{name}{_labels(key)} {_number(value)}")
+
+            for name in sorted(self._histograms):
+                header(name)
+                for key, histogram in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(key + (('le', _number(bound)),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_labels(key + (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{_labels(key)} {_number(histogram.sum)}")
+                    lines.append(f"{name}_count{_labels(key)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    pairs = (
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in key
+    )
+    return "{" + ",".join(pairs) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# Shared by every module that records timings or counts
+metrics = Metrics()
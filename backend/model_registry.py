@@ -0,0 +1,176 @@
+import asyncio
+import json
+import logging
+import os
+from time import monotonic
+from typing import Dict, Iterable, Optional, Tuple
+
+import litellm
+from pyzerox.errors import ModelAccessError
+from pyzerox.models import litellmmodel
+from pyzerox.models.base import BaseModel
+
+from scheduler import ModelScheduler, is_transient_error
+
+logger = logging.getLogger("supaocr.models")
+
+# Minimum time between validation attempts of a model after one fails
+FAILURE_TTL_SECONDS = 60.0
+
+# The same round-trip litellm.check_valid_key makes, reserved against the scheduler budget
+ACCESS_CHECK_MESSAGES = [{"role": "user", "content": "Hey, how's it going?"}]
+ACCESS_CHECK_TOKENS = 50
+
+# Scheduler lane validation calls share, so they queue fairly with documents
+VALIDATION_DOCUMENT_ID = "model-validation"
+
+
+class ModelRegistry:
+    """
+    Shared, pre-validated litellmmodel instances.
+
+    litellmmodel.__init__ validates the environment, the model and API access, and the
+    last one is a real completion round-trip. The registry builds each instance once,
+    skipping those checks, and runs them separately. With a scheduler, the access check
+    counts against the shared concurrency and rate limits like any other model call.
+
+    Once a model has validated, getting it makes no network calls and it keeps being
+    served: an expired validation is refreshed in the background, and a failed refresh
+    is logged, not raised. Only a model that has never validated raises, and failures
+    from transient errors (rate limits, timeouts, 5xx) are never cached.
+    """
+
+    def __init__(self, validation_ttl: float = 3600.0, scheduler: Optional[ModelScheduler] = None):
+        self.validation_ttl = validation_ttl
+        self.scheduler = scheduler
+
+        self._instances: Dict[Tuple[str, str, str], litellmmodel] = {}
+        # model name -> when it last validated successfully
+        self._validated_at: Dict[str, float] = {}
+        # model name -> (attempted_at, error or None) of the latest validation attempt
+        self._attempts: Dict[str, Tuple[float, Optional[Exception]]] = {}
+        self._pending: Dict[str, asyncio.Task] = {}
+
+        self.validations_run = 0
+
+    @classmethod
+    def from_env(cls, scheduler: Optional[ModelScheduler] = None) -> "ModelRegistry":
+        """Build a registry from MODEL_VALIDATION_TTL (seconds)."""
+        return cls(validation_ttl=float(os.getenv("MODEL_VALIDATION_TTL", "3600")), scheduler=scheduler)
+
+    def _build(self, model: str, custom_system_prompt: Optional[str], kwargs: dict) -> litellmmodel:
+        # Bypass litellmmodel.__init__, which would validate on every construction
+        instance = litellmmodel.__new__(litellmmodel)
+        BaseModel.__init__(instance, model=model, **kwargs)
+        if custom_system_prompt:
+            instance.system_prompt = custom_system_prompt
+        return instance
+
+    def _check_local(self, instance: litellmmodel) -> None:
+        instance.validate_environment()
+        instance.validate_model()
+
+    async def _check_access(self, instance: litellmmodel) -> None:
+        # litellm.check_valid_key returns False for any exception, which hides whether the
+        # key is bad or the provider was just busy, so make the same call directly
+        def call():
+            # No SDK retries under the scheduler, which does its own backoff and counts every attempt
+            return litellm.acompletion(
+                model=instance.model, messages=ACCESS_CHECK_MESSAGES, max_tokens=10,
+                **({"max_retries": 0} if self.scheduler is not None else {}),
+            )
+
+        try:
+            if self.scheduler is not None:
+                await self.scheduler.run(VALIDATION_DOCUMENT_ID, call, estimated_tokens=ACCESS_CHECK_TOKENS)
+            else:
+                await call()
+        except Exception as err:
+            if is_transient_error(err):
+                raise
+            raise ModelAccessError(extra_info={"model": instance.model, "error": str(err)}) from err
+
+    async def _validate(self, instance: litellmmodel) -> None:
+        model = instance.model
+        error = None
+        try:
+            await asyncio.to_thread(self._check_local, instance)
+            await self._check_access(instance)
+            self._validated_at[model] = monotonic()
+            logger.info(f"Validated model {model}")
+        except Exception as err:
+            error = err
+            if is_transient_error(err):
+                logger.warning(f"Could not validate model {model}, will retry: {err}")
+            else:
+                logger.error(f"Model {model} failed validation: {err}")
+        self.validations_run += 1
+        self._attempts[model] = (monotonic(), error)
+
+    def _validation_task(self, instance: litellmmodel) -> asyncio.Task:
+        # Concurrent callers share a single in-flight validation per model
+        task = self._pending.get(instance.model)
+        if task is None or task.done():
+            task = asyncio.create_task(self._validate(instance))
+            self._pending[instance.model] = task
+        return task
+
+    async def get(
+        self,
+        model: str = "gpt-4o-mini",
+        custom_system_prompt: Optional[str] = None,
+        **kwargs
+    ) -> litellmmodel:
+        """
+        Return the shared instance for this model, system prompt and completion kwargs.
+
+        Only the first use of a model that never validated waits on validation. Raises
+        if that validation fails, or while a non-transient failure is still fresh.
+        """
+        key = (model, custom_system_prompt or "", json.dumps(kwargs, sort_keys=True, default=str))
+        instance = self._instances.get(key)
+        if instance is None:
+            instance = self._instances[key] = self._build(model, custom_system_prompt, kwargs)
+
+        now = monotonic()
+        attempt = self._attempts.get(model)
+        validated_at = self._validated_at.get(model)
+
+        if validated_at is not None:
+            # Refresh in the background, and after a failed refresh not more often than FAILURE_TTL_SECONDS
+            if now - validated_at >= self.validation_ttl and (
+                attempt is None or attempt[1] is None or now - attempt[0] >= FAILURE_TTL_SECONDS
+            ):
+                self._validation_task(instance)
+            return instance
+
+        if attempt is not None and attempt[1] is not None and not is_transient_error(attempt[1]) \
+                and now - attempt[0] < FAILURE_TTL_SECONDS:
+            raise attempt[1]
+
+        await self._validation_task(instance)
+        if model not in self._validated_at:
+            raise self._attempts[model][1]
+        return instance
+
+    async def warm(self, models: Iterable[str]) -> None:
+        """Validate models ahead of the first request, e.g. at app startup."""
+        await asyncio.gather(*(self._validation_task(self._build(model, None, {})) for model in models))
+
+    def stats(self) -> dict:
+        now = monotonic()
+        models = {}
+        for model, (attempted_at, error) in self._attempts.items():
+            validated_at = self._validated_at.get(model)
+            models[model] = {
+                # Served as long as it ever validated
+                "valid": validated_at is not None,
+                "age_seconds": round(now - validated_at, 1) if validated_at is not None else None,
+                "last_attempt_seconds": round(now - attempted_at, 1),
+                "error": str(error) if error is not None else None,
+            }
+        return {
+            "instances": len(self._instances),
+            "validations_run": self.validations_run,
+            "models": models,
+        }
@@ -0,0 +1,619 @@
+import os
+import asyncio
+import base64
+import logging
+import tempfile
+import uuid
+import warnings
+from dataclasses import dataclass
+from datetime import datetime
+from time import time
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import aiofiles
+import aiofiles.os as async_os
+import aioshutil as async_shutil
+import litellm
+from pyzerox.constants.messages import Messages
+from pyzerox.core.types import Page, ZeroxOutput
+from pyzerox.errors import FileUnavailable
+from pyzerox.models import litellmmodel
+from pyzerox.models.base import BaseModel
+from pyzerox.processor import download_file, format_markdown
+from pyzerox.processor.utils import is_valid_url
+
+from page_cache import CachedPage, PageCache, page_cache_key
+from encoding import EncodedPage, encode_page, get_profile
+from formatting import build_anchor, can_conflict, conflicts
+from metrics import metrics
+from rasterize import RENDER_CHUNK_PAGES, render_pages, resolve_page_numbers
+from scheduler import ModelScheduler
+from text_layer import TextLayer
+
+# Rough prompt + completion size of one page, reserved against the TPM budget before a call
+ESTIMATED_PAGE_TOKENS = 1500
+
+# How maintain_format carries formatting across pages:
+#   "sequential": each page sees the previous page's markdown, so pages run one at a time (pyzerox)
+#   "anchored": every page sees an anchor taken from the first page and runs in parallel; pages
+#       that then disagree with the page before them are re-run against it
+FORMAT_MODES = ("sequential", "anchored")
+
+
+@dataclass
+class PageResult(Page):
+    """
+    A pyzerox Page plus what it cost to produce.
+    """
+
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached: bool = False
+    # Blank pages are detected locally and never sent to the model
+    blank: bool = False
+    image_bytes: int = 0
+    image_format: str = ""
+    # How the page was produced: "model", "cache", "text" (embedded text layer) or "blank"
+    route: str = "model"
+    # Re-run against the previous page because its structure disagreed with it
+    reformatted: bool = False
+
+
+@dataclass
+class OcrOutput(ZeroxOutput):
+    """
+    ZeroxOutput plus page cache and image payload accounting for this document.
+    """
+
+    cache_hits: int = 0
+    cache_misses: int = 0
+    blank_pages: int = 0
+    text_pages: int = 0
+    image_bytes: int = 0
+    reformatted_pages: int = 0
+
+
+def prepare_messages(
+    model: litellmmodel,
+    image_data: bytes,
+    prior_page: str = "",
+    mime_type: str = "image/png",
+) -> List[Dict[str, Any]]:
+    """Build the same messages as litellmmodel._prepare_messages, from in-memory image bytes."""
+    messages: List[Dict[str, Any]] = [
+        {
+            "role": "system",
+            "content": model.system_prompt,
+        },
+    ]
+
+    # pyzerox's process_page always asks for format context, so it applies whenever a prior page exists
+    if prior_page:
+        messages.append(
+            {
+                "role": "system",
+                "content": f'Markdown must maintain consistent formatting with the following page: \n\n """{prior_page}"""',
+            },
+        )
+
+    with metrics.span("base64"):
+        base64_image = base64.b64encode(image_data).decode("utf-8")
+    messages.append(
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:{mime_type};base64,{base64_image}"},
+                },
+            ],
+        }
+    )
+    return messages
+
+
+async def process_page(
+    image_data: bytes,
+    model: litellmmodel,
+    prior_page: str = "",
+    scheduler: Optional[ModelScheduler] = None,
+    document_id: str = "",
+    mime_type: str = "image/png",
+) -> Tuple[str, int, int]:
+    """
+    In-memory counterpart of pyzerox.processor.process_page.
+
+    With a scheduler, the call is admitted under the shared concurrency and rate limits
+    and retried on rate limit errors. Like pyzerox, a completion that still fails is
+    logged and returned as an empty page.
+    """
+    messages = prepare_messages(model, image_data, prior_page, mime_type)
+    # The OpenAI SDK retries 429s itself by default, on its own timer while holding a
+    # scheduler slot and uncounted by the rate limit window; leave retries to the scheduler
+    kwargs = {**model.kwargs, "max_retries": 0} if scheduler is not None else model.kwargs
+
+    async def call():
+        # Timed per attempt, excluding time spent queued in the scheduler
+        with metrics.span("model"):
+            return await litellm.acompletion(model=model.model, messages=messages, **kwargs)
+
+    try:
+        if scheduler is not None:
+            response = await scheduler.run(
+                document_id,
+                call,
+                estimated_tokens=ESTIMATED_PAGE_TOKENS + len(prior_page) // 4,
+                count_tokens=lambda response: response["usage"]["prompt_tokens"] + response["usage"]["completion_tokens"],
+            )
+        else:
+            response = await call()
+        with metrics.span("format_markdown"):
+            content = format_markdown(response["choices"][0]["message"]["content"])
+        metrics.inc("supaocr_model_calls_total", outcome="ok")
+        metrics.inc("supaocr_tokens_total", response["usage"]["prompt_tokens"], direction="input")
+        metrics.inc("supaocr_tokens_total", response["usage"]["completion_tokens"], direction="output")
+        return content, response["usage"]["prompt_tokens"], response["usage"]["completion_tokens"]
+
+    except Exception as error:
+        metrics.inc("supaocr_model_calls_total", outcome="error")
+        logging.error(f"{Messages.FAILED_TO_PROCESS_IMAGE} Error:{Messages.COMPLETION_ERROR.format(error)}")
+        return "", 0, 0
+
+
+async def process_page_cached(
+    image: EncodedPage,
+    model: litellmmodel,
+    prior_page: str = "",
+    maintain_format: bool = False,
+    cache: Optional[PageCache] = None,
+    scheduler: Optional[ModelScheduler] = None,
+    document_id: str = "",
+) -> Tuple[str, int, int, bool]:
+    """
+    Process a single rendered page, consulting the page cache first.
+
+    Returns the markdown, the input and output tokens spent, and whether it was a cache hit.
+    Cache hits never reach the model and always cost zero tokens.
+    """
+    key = None
+    if cache is not None:
+        key = page_cache_key(
+            image.data,
+            model=model.model,
+            system_prompt=model.system_prompt,
+            prior_page=prior_page if maintain_format else "",
+            completion_kwargs=model.kwargs,
+        )
+        cached = await cache.get(key)
+        if cached is not None:
+            return cached.content, 0, 0, True
+
+    start = time()
+    content, input_tokens, output_tokens = await process_page(
+        image.data, model, prior_page=prior_page, scheduler=scheduler, document_id=document_id,
+        mime_type=image.mime_type,
+    )
+
+    # Failed pages come back empty, never cache those
+    if key is not None and content:
+        await cache.put(
+            key,
+            CachedPage(
+                content=content,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                latency=time() - start,
+            ),
+        )
+    return content, input_tokens, output_tokens, False
+
+
+def _file_name(path: str) -> str:
+    """Normalise a file name the same way pyzerox does for its output files."""
+    raw_file_name = os.path.splitext(os.path.basename(path))[0]
+    return "".join(c.lower() if c.isalnum() else "_" for c in raw_file_name)[:255]
+
+
+async def stream_pages(
+    cleanup: bool = True,
+    concurrency: int = 10,
+    file_path: Optional[str] = "",
+    maintain_format: bool = False,
+    model: Union[str, BaseModel] = "gpt-4o-mini",
+    temp_dir: Optional[str] = None,
+    custom_system_prompt: Optional[str] = None,
+    select_pages: Optional[Union[int, Iterable[int]]] = None,
+    cache: Optional[PageCache] = None,
+    max_buffered_pages: Optional[int] = None,
+    scheduler: Optional[ModelScheduler] = None,
+    encoding_profile: str = "adaptive",
+    text_layer_min_quality: Optional[float] = None,
+    format_mode: str = "anchored",
+    **kwargs
+) -> AsyncIterator[PageResult]:
+    """
+    Run OCR over a document and yield each page as soon as it finishes.
+
+    Pages are rendered in small chunks and encoded in memory; model calls start as soon
+    as the first page is ready. At most `max_buffered_pages` encoded pages (defaults to
+    `concurrency`) wait between the renderer and the model workers, which bounds memory.
+
+    With a scheduler, `concurrency` only caps this document's workers; the scheduler
+    enforces the process-wide limits and fairness across documents.
+
+    Pages whose embedded text layer scores at least `text_layer_min_quality`, and that have
+    no tables, images or drawings, are converted locally and never rendered. Off by default. The rest are encoded according to
+    `encoding_profile` (see encoding.PROFILES); pages found to be blank are yielded
+    straight away without a model call.
+
+    With maintain_format, `format_mode` (see FORMAT_MODES) picks between pyzerox's
+    page-by-page processing and anchored mode. In anchored mode the first non-blank
+    page becomes the format anchor, and the remaining pages run in parallel once it exists.
+    A page is only yielded once the page before it is done, so pages whose tables or
+    headings disagree with it can be re-run with it as context first. At most
+    `max_buffered_pages` pages keep their image while waiting, beyond that workers wait.
+
+    Local files are read in place, only URLs are downloaded (into `temp_dir`).
+    Pages arrive in completion order, not page order, unless format_mode is "sequential".
+    Failed pages are yielded with empty content so consumers can account for every page.
+    Takes the same arguments as zerox(), minus output_dir.
+    """
+    if not file_path:
+        raise FileUnavailable()
+
+    profile = get_profile(encoding_profile)
+    if format_mode not in FORMAT_MODES:
+        raise ValueError(f"Unknown format mode {format_mode!r}, expected one of {FORMAT_MODES}")
+    sequential = maintain_format and format_mode == "sequential"
+    anchored = maintain_format and format_mode == "anchored"
+
+    if isinstance(model, BaseModel):
+        vision_model = model
+    else:
+        vision_model = litellmmodel(model=model, **kwargs)
+        if custom_system_prompt:
+            vision_model.system_prompt = custom_system_prompt
+
+    if maintain_format and select_pages is not None:
+        warnings.warn(Messages.MAINTAIN_FORMAT_SELECTED_PAGES_WARNING)
+
+    if isinstance(select_pages, int):
+        select_pages = [select_pages]
+    if select_pages is not None:
+        select_pages = sorted(select_pages)
+
+    if temp_dir:
+        if os.path.exists(temp_dir):
+            await async_shutil.rmtree(temp_dir)
+        await async_os.makedirs(temp_dir, exist_ok=True)
+
+    document_id = uuid.uuid4().hex
+
+    with tempfile.TemporaryDirectory() as temp_dir_:
+        temp_directory = temp_dir or temp_dir_
+        tasks: List[asyncio.Task] = []
+
+        try:
+            if is_valid_url(file_path):
+                local_path = await download_file(file_path=file_path, temp_dir=temp_directory)
+            else:
+                local_path = file_path
+            if not local_path or not os.path.exists(local_path):
+                raise FileUnavailable()
+
+            page_numbers = await resolve_page_numbers(local_path, select_pages)
+
+            # Sequential formatting needs pages in order with the previous page's markdown, so it gets one worker
+            workers = 1 if sequential else max(1, min(concurrency, len(page_numbers)))
+            page_queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffered_pages or concurrency)
+            result_queue: asyncio.Queue = asyncio.Queue()
+
+            text_layer = TextLayer(local_path) if text_layer_min_quality is not None else None
+
+            # Anchored mode: the anchor every other page is formatted against, each finished
+            # page (with its image until it is checked against the page before it), and the
+            # pages whose content is final, i.e. checked and re-run if needed
+            format_anchor = ""
+            anchor_ready = asyncio.Event()
+            finished: Dict[int, Tuple[PageResult, Optional[EncodedPage]]] = {}
+            final: Set[int] = set()
+            position = {page_number: index for index, page_number in enumerate(page_numbers)}
+            # Pages holding their image while they wait on the page before them, capped like the page queue
+            holding: Set[int] = set()
+            hold_limit = max_buffered_pages or concurrency
+            room = asyncio.Event()
+
+            def spawn(coroutine) -> None:
+                task = asyncio.create_task(coroutine)
+                task.add_done_callback(forward_error)
+                tasks.append(task)
+
+            async def reformat(result: PageResult, encoded: EncodedPage, previous: str) -> None:
+                content, input_tokens, output_tokens, cached = await process_page_cached(
+                    encoded, vision_model, previous, True, cache, scheduler, document_id
+                )
+                # Keep the first attempt if the re-run fails
+                if content:
+                    result.content = content
+                    result.content_length = len(content)
+                    result.reformatted = True
+                result.input_tokens += input_tokens
+                result.output_tokens += output_tokens
+                result.image_bytes += 0 if cached else len(encoded.data)
+                await result_queue.put(result)
+                await settle(result.page)
+
+            async def release(page_number: int) -> bool:
+                """Check a page against its predecessor's final content. False if it is being re-run."""
+                result, encoded = finished[page_number]
+                finished[page_number] = (result, None)
+                if page_number in holding:
+                    holding.discard(page_number)
+                    room.set()
+                index = position[page_number]
+                previous = finished[page_numbers[index - 1]][0].content if index else ""
+                if encoded is not None and conflicts(result.content, previous, format_anchor):
+                    spawn(reformat(result, encoded, previous))
+                    return False
+                await result_queue.put(result)
+                return True
+
+            async def settle(page_number: int) -> None:
+                # Mark the page final and release the run of finished pages that were waiting on it
+                while True:
+                    final.add(page_number)
+                    # A page waiting for room to hold its image can now be checked right away
+                    room.set()
+                    index = position[page_number] + 1
+                    if index == len(page_numbers) or page_numbers[index] not in finished:
+                        return
+                    page_number = page_numbers[index]
+                    if not await release(page_number):
+                        return
+
+            async def finish(result: PageResult, encoded: Optional[EncodedPage] = None) -> None:
+                if not anchored:
+                    await result_queue.put(result)
+                    return
+                # Release a page once the page before it is final; otherwise settling that page releases it
+                index = position[result.page]
+
+                def ready() -> bool:
+                    return index == 0 or page_numbers[index - 1] in final
+
+                if encoded is not None and not can_conflict(result.content):
+                    # Nothing conflicts() could flag, so the page will never be re-run
+                    encoded = None
+                if encoded is not None:
+                    # A slow page would otherwise pin the images of every page after it
+                    while len(holding) >= hold_limit and not ready():
+                        room.clear()
+                        await room.wait()
+                    if not ready():
+                        holding.add(result.page)
+                finished[result.page] = (result, encoded)
+                if ready() and await release(result.page):
+                    await settle(result.page)
+
+            def route_text(group: List[int]) -> List[Optional[str]]:
+                texts = []
+                for page_number in group:
+                    with metrics.span("text_layer"):
+                        texts.append(text_layer.markdown(page_number, text_layer_min_quality))
+                return texts
+
+            def encode(image) -> EncodedPage:
+                with metrics.span("image_encode"):
+                    return encode_page(image, profile)
+
+            async def produce() -> None:
+                nonlocal format_anchor
+                anchor_pending = anchored
+                for start in range(0, len(page_numbers), RENDER_CHUNK_PAGES):
+                    group = page_numbers[start:start + RENDER_CHUNK_PAGES]
+                    texts = await asyncio.to_thread(route_text, group) if text_layer else [None] * len(group)
+
+                    # Pages are handed on in page order, so the single sequential worker sees
+                    # text, blank and rendered pages exactly as they appear in the document
+                    rendered = render_pages(local_path, [page for page, text in zip(group, texts) if text is None])
+                    try:
+                        for page_number, text in zip(group, texts):
+                            if text is not None:
+                                result = PageResult(content=text, content_length=len(text), page=page_number, route="text")
+                                if anchor_pending:
+                                    format_anchor = build_anchor(text)
+                                    anchor_ready.set()
+                                    anchor_pending = False
+                                if sequential:
+                                    await page_queue.put(result)
+                                else:
+                                    await finish(result)
+                                continue
+
+                            _, image = await anext(rendered)
+                            encoded = await asyncio.to_thread(encode, image)
+                            image.close()
+                            if encoded.blank:
+                                result = PageResult(content="", content_length=0, page=page_number, blank=True, route="blank")
+                                if sequential:
+                                    await page_queue.put(result)
+                                else:
+                                    await finish(result)
+                            else:
+                                await page_queue.put((page_number, encoded, anchor_pending))
+                                anchor_pending = False
+                    finally:
+                        await rendered.aclose()
+
+                if anchor_pending:
+                    # Nothing to anchor to, e.g. every page was blank
+                    anchor_ready.set()
+                for _ in range(workers):
+                    await page_queue.put(None)
+
+            async def consume() -> None:
+                nonlocal format_anchor
+                prior_page = ""
+                while (item := await page_queue.get()) is not None:
+                    if isinstance(item, PageResult):
+                        # Blank pages carry no formatting, so the context stays with the page before
+                        if not item.blank:
+                            prior_page = item.content
+                        await result_queue.put(item)
+                        continue
+
+                    page_number, encoded, is_anchor = item
+                    if anchored and not is_anchor:
+                        await anchor_ready.wait()
+                        prior_page = format_anchor
+                    content, input_tokens, output_tokens, cached = await process_page_cached(
+                        encoded, vision_model, prior_page, maintain_format, cache, scheduler, document_id
+                    )
+                    if sequential:
+                        # pyzerox resets the format context after a failed page, mirror that here
+                        prior_page = content
+                    if is_anchor:
+                        format_anchor = build_anchor(content)
+                        anchor_ready.set()
+                    await finish(
+                        PageResult(
+                            content=content,
+                            content_length=len(content),
+                            page=page_number,
+                            input_tokens=input_tokens,
+                            output_tokens=output_tokens,
+                            cached=cached,
+                            # Bytes actually sent to the model; cache hits send nothing
+                            image_bytes=0 if cached else len(encoded.data),
+                            image_format=encoded.mime_type,
+                            route="cache" if cached else "model",
+                        ),
+                        encoded,
+                    )
+
+            def forward_error(task: asyncio.Task) -> None:
+                if not task.cancelled() and task.exception() is not None:
+                    result_queue.put_nowait(task.exception())
+
+            spawn(produce())
+            for _ in range(workers):
+                spawn(consume())
+
+            for _ in page_numbers:
+                result = await result_queue.get()
+                if isinstance(result, BaseException):
+                    raise result
+                metrics.inc("supaocr_pages_total", route=result.route)
+                yield result
+
+        finally:
+            # The consumer may stop early (e.g. a client disconnects mid-stream)
+            for task in tasks:
+                task.cancel()
+            if cleanup and os.path.exists(temp_directory):
+                await async_shutil.rmtree(temp_directory)
+
+
+def build_output(
+    file_path: str,
+    pages: List[PageResult],
+    start_time: datetime,
+    cache: Optional[PageCache] = None,
+) -> OcrOutput:
+    """Assemble the final OcrOutput from streamed pages, dropping blank and failed pages."""
+    pages = sorted(pages, key=lambda page: page.page)
+    cache_hits = sum(1 for page in pages if page.cached)
+    blank_pages = sum(1 for page in pages if page.blank)
+    text_pages = sum(1 for page in pages if page.route == "text")
+    reformatted_pages = sum(1 for page in pages if page.reformatted)
+
+    return OcrOutput(
+        completion_time=(datetime.now() - start_time).total_seconds() * 1000,
+        file_name=_file_name(file_path),
+        input_tokens=sum(page.input_tokens for page in pages),
+        output_tokens=sum(page.output_tokens for page in pages),
+        pages=[page for page in pages if page.content],
+        cache_hits=cache_hits,
+        cache_misses=len(pages) - blank_pages - text_pages - cache_hits if cache is not None else 0,
+        blank_pages=blank_pages,
+        text_pages=text_pages,
+        image_bytes=sum(page.image_bytes for page in pages),
+        reformatted_pages=reformatted_pages,
+    )
+
+
+async def zerox(
+    cleanup: bool = True,
+    concurrency: int = 10,
+    file_path: Optional[str] = "",
+    maintain_format: bool = False,
+    model: Union[str, BaseModel] = "gpt-4o-mini",
+    output_dir: Optional[str] = None,
+    temp_dir: Optional[str] = None,
+    custom_system_prompt: Optional[str] = None,
+    select_pages: Optional[Union[int, Iterable[int]]] = None,
+    cache: Optional[PageCache] = None,
+    max_buffered_pages: Optional[int] = None,
+    scheduler: Optional[ModelScheduler] = None,
+    encoding_profile: str = "adaptive",
+    text_layer_min_quality: Optional[float] = None,
+    format_mode: str = "anchored",
+    **kwargs
+) -> OcrOutput:
+    """
+    Drop-in replacement for pyzerox.zerox that renders pages in memory and consults a page
+    cache before calling the model.
+
+    Accepts the same arguments as pyzerox.zerox, plus:
+
+    :param model: A model name, or a ready, already validated model instance (e.g. from
+        ModelRegistry) to skip per-call validation. custom_system_prompt and kwargs only
+        apply when a name is given.
+    :type model: str or BaseModel, optional
+
+    :param cache: Page result cache shared across requests, defaults to None (no caching)
+    :type cache: PageCache, optional
+    :param max_buffered_pages: Rendered pages held in memory ahead of the model, defaults to concurrency
+    :type max_buffered_pages: int, optional
+    :param scheduler: Shared admission control for model calls across requests, defaults to None
+    :type scheduler: ModelScheduler, optional
+    :param encoding_profile: Name of the page image encoding profile, defaults to "adaptive". Use "png" for pyzerox's behaviour
+    :type encoding_profile: str, optional
+    :param text_layer_min_quality: Minimum text layer quality score (0-1) for a page to skip the vision model, e.g. text_layer.DEFAULT_MIN_QUALITY. Defaults to None, which sends every page to the model
+    :type text_layer_min_quality: float, optional
+    :param format_mode: How maintain_format keeps pages consistent, defaults to "anchored" (parallel, see FORMAT_MODES). Use "sequential" for pyzerox's page-by-page behaviour
+    :type format_mode: str, optional
+    """
+    start_time = datetime.now()
+
+    if output_dir:
+        await async_os.makedirs(output_dir, exist_ok=True)
+
+    pages = [
+        page
+        async for page in stream_pages(
+            cleanup=cleanup,
+            concurrency=concurrency,
+            file_path=file_path,
+            maintain_format=maintain_format,
+            model=model,
+            temp_dir=temp_dir,
+            custom_system_prompt=custom_system_prompt,
+            select_pages=select_pages,
+            cache=cache,
+            max_buffered_pages=max_buffered_pages,
+            scheduler=scheduler,
+            encoding_profile=encoding_profile,
+            text_layer_min_quality=text_layer_min_quality,
+            format_mode=format_mode,
+            **kwargs,
+        )
+    ]
+    output = build_output(file_path, pages, start_time, cache)
+
+    if output_dir:
+        result_file_path = os.path.join(output_dir, f"{output.file_name}.md")
+        async with aiofiles.open(result_file_path, "w") as f:
+            await f.write("\n\n".join(page.content for page in output.pages))
+
+    return output
@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+logger = logging.getLogger("supaocr.cache")
+
+
+@dataclass
+class CachedPage:
+    """
+    A page result stored in the cache, along with what it originally cost to produce.
+    """
+
+    content: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+    latency: float = 0.0
+
+
+def page_cache_key(
+    image_data: bytes,
+    model: str,
+    system_prompt: str,
+    prior_page: str = "",
+    completion_kwargs: Optional[dict] = None,
+) -> str:
+    """
+    Hash a rendered page image together with everything that influences the model output.
+
+    `completion_kwargs` are the extra arguments passed to the completion call, such as
+    max_tokens or temperature, so results produced with different ones never collide.
+    """
+    digest = hashlib.sha256()
+    kwargs = json.dumps(completion_kwargs or {}, sort_keys=True, default=str)
+    for part in (model, system_prompt, prior_page, kwargs):
+        encoded = (part or "").encode("utf-8")
+        digest.update(len(encoded).to_bytes(8, "big"))
+        digest.update(encoded)
+    digest.update(image_data)
+    return digest.hexdigest()
+
+
+class PageCache:
+    """
+    Two-tier, content-addressed cache of page results.
+
+    The memory tier is a plain LRU bounded by entry count. The disk tier stores one JSON
+    file per page under `disk_dir` and evicts least recently used files once their total
+    size exceeds `max_disk_bytes`. Set `disk_dir` to None to run memory-only.
+    """
+
+    def __init__(
+        self,
+        max_memory_entries: int = 256,
+        disk_dir: Optional[str] = None,
+        max_disk_bytes: int = 512 * 1024 * 1024,
+    ):
+        self.max_memory_entries = max_memory_entries
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory: "OrderedDict[str, CachedPage]" = OrderedDict()
+        self._disk_index: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.saved_input_tokens = 0
+        self.saved_output_tokens = 0
+        self.saved_seconds = 0.0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    @classmethod
+    def from_env(cls) -> "PageCache":
+        """Build a cache from PAGE_CACHE_* environment variables."""
+        return cls(
+            max_memory_entries=int(os.getenv("PAGE_CACHE_MEMORY_ENTRIES", "256")),
+            disk_dir=os.getenv("PAGE_CACHE_DIR", "/tmp/supaocr-cache") or None,
+            max_disk_bytes=int(os.getenv("PAGE_CACHE_DISK_MB", "512")) * 1024 * 1024,
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _load_disk_index(self) -> None:
+        """Rebuild the disk LRU order from file modification times."""
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-len(".json")], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._disk_index[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        while self._disk_bytes > self.max_disk_bytes and self._disk_index:
+            key, size = self._disk_index.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _remember(self, key: str, page: CachedPage) -> None:
+        self._memory[key] = page
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key: str) -> Optional[CachedPage]:
+        with self._lock:
+            if key not in self._disk_index:
+                return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                page = CachedPage(**json.load(f))
+            os.utime(path)
+        except (OSError, ValueError, TypeError) as err:
+            logger.warning(f"Dropping unreadable cache entry {key}: {err}")
+            with self._lock:
+                self._disk_bytes -= self._disk_index.pop(key, 0)
+            return None
+        with self._lock:
+            if key in self._disk_index:
+                self._disk_index.move_to_end(key)
+        return page
+
+    def _write_disk(self, key: str, page: CachedPage) -> None:
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        data = json.dumps(asdict(page)).encode("utf-8")
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as err:
+            logger.warning(f"Failed to write cache entry {key}: {err}")
+            return
+        with self._lock:
+            self._disk_bytes += len(data) - self._disk_index.pop(key, 0)
+            self._disk_index[key] = len(data)
+            self._evict_disk()
+
+    def _record_hit(self, page: CachedPage) -> None:
+        self.saved_input_tokens += page.input_tokens
+        self.saved_output_tokens += page.output_tokens
+        self.saved_seconds += page.latency
+
+    async def get(self, key: str) -> Optional[CachedPage]:
+        """Look a page up in memory, then on disk. Disk hits are promoted to memory."""
+        page = self._memory.get(key)
+        if page is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            self._record_hit(page)
+            return page
+
+        if self.disk_dir:
+            page = await asyncio.to_thread(self._read_disk, key)
+            if page is not None:
+                self._remember(key, page)
+                self.disk_hits += 1
+                self._record_hit(page)
+                return page
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, page: CachedPage) -> None:
+        """Store a page result in both tiers."""
+        self._remember(key, page)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, page)
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self._disk_index),
+            "disk_bytes": self._disk_bytes,
+            "saved_input_tokens": self.saved_input_tokens,
+            "saved_output_tokens": self.saved_output_tokens,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
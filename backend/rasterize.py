@@ -0,0 +1,80 @@
+import asyncio
+from time import perf_counter
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+
+from PIL import Image
+from pdf2image import convert_from_path, pdfinfo_from_path
+from pyzerox.constants import PDFConversionDefaultOptions
+from pyzerox.errors.exceptions import PageNumberOutOfBoundError
+
+from metrics import metrics
+
+# Pages rendered per poppler invocation. Small chunks let the first model call start
+# after one chunk is rendered instead of after the whole document.
+RENDER_CHUNK_PAGES = 4
+
+
+async def count_pages(local_path: str) -> int:
+    """Return the number of pages in a PDF without rendering it."""
+    info = await asyncio.to_thread(pdfinfo_from_path, local_path)
+    return int(info["Pages"])
+
+
+async def resolve_page_numbers(
+    local_path: str,
+    select_pages: Optional[List[int]] = None,
+) -> List[int]:
+    """Return the 1-indexed pages to process, validating select_pages against the document."""
+    total_pages = await count_pages(local_path)
+    if select_pages is None:
+        return list(range(1, total_pages + 1))
+
+    invalid_page_numbers = [page for page in select_pages if page < 1 or page > total_pages]
+    if invalid_page_numbers:
+        raise PageNumberOutOfBoundError(extra_info={"input_pdf_num_pages": total_pages,
+                                                    "select_pages": select_pages,
+                                                    "invalid_page_numbers": invalid_page_numbers})
+    return select_pages
+
+
+def _chunks(page_numbers: Iterable[int], size: int) -> List[Tuple[int, int]]:
+    """Group sorted page numbers into contiguous (first, last) runs of at most `size` pages."""
+    runs: List[Tuple[int, int]] = []
+    for page in page_numbers:
+        if runs and page == runs[-1][1] + 1 and page - runs[-1][0] < size:
+            runs[-1] = (runs[-1][0], page)
+        else:
+            runs.append((page, page))
+    return runs
+
+
+def _render(local_path: str, first_page: int, last_page: int) -> List[Image.Image]:
+    # pdftoppm writes raw PPM to stdout when no output folder is given, so pages are
+    # parsed straight from the pipe instead of going through PNG files on disk.
+    start = perf_counter()
+    images = convert_from_path(
+        local_path,
+        dpi=PDFConversionDefaultOptions.DPI,
+        fmt="ppm",
+        size=PDFConversionDefaultOptions.SIZE,
+        first_page=first_page,
+        last_page=last_page,
+        thread_count=1,
+        use_pdftocairo=False,
+    )
+    # Recorded per page so chunk size changes don't skew the histogram
+    for _ in images:
+        metrics.observe_stage("rasterize", (perf_counter() - start) / len(images))
+    return images
+
+
+async def render_pages(
+    local_path: str,
+    page_numbers: List[int],
+    chunk_pages: int = RENDER_CHUNK_PAGES,
+) -> AsyncIterator[Tuple[int, Image.Image]]:
+    """Render pages in small chunks, yielding (page_number, image) in page order."""
+    for first_page, last_page in _chunks(page_numbers, chunk_pages):
+        images = await asyncio.to_thread(_render, local_path, first_page, last_page)
+        for page_number, image in zip(range(first_page, last_page + 1), images):
+            yield page_number, image
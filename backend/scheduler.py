@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import os
+import random
+from collections import OrderedDict, deque
+from time import monotonic
+from typing import Awaitable, Callable, Deque, List, Optional, TypeVar
+
+import litellm
+
+from metrics import metrics
+
+logger = logging.getLogger("supaocr.scheduler")
+
+T = TypeVar("T")
+
+# Rate limit budgets are enforced over a sliding window of this many seconds
+WINDOW_SECONDS = 60.0
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True for provider 429s, however litellm or the SDK surfaced them."""
+    if isinstance(error, litellm.RateLimitError):
+        return True
+    return getattr(error, "status_code", None) == 429
+
+
+def is_transient_error(error: Exception) -> bool:
+    """True for rate limits, timeouts, connection problems and provider 5xx errors, which say nothing about the request."""
+    if is_rate_limit_error(error):
+        return True
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError, litellm.Timeout, litellm.APIConnectionError,
+                          litellm.ServiceUnavailableError, litellm.InternalServerError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return isinstance(status_code, int) and status_code >= 500
+
+
+class ModelScheduler:
+    """
+    Process-wide admission control for model calls.
+
+    All documents share one pool of `max_concurrency` in-flight calls. When the pool is
+    full, waiting calls are queued per document and slots are handed out round-robin
+    across documents, so a large upload cannot starve small ones. Calls are additionally
+    held back to stay within `requests_per_minute` and `tokens_per_minute`, and rate
+    limit errors are retried with exponential backoff and full jitter.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 20,
+        requests_per_minute: int = 500,
+        tokens_per_minute: int = 200_000,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._active = 0
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        # Sliding window of [timestamp, tokens] for calls admitted in the last minute
+        self._window: Deque[List[float]] = deque()
+        self._budget_lock = asyncio.Lock()
+
+        self.requests = 0
+        self.rate_limited = 0
+        self.retries = 0
+        self.failures = 0
+        self.wait_count = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> "ModelScheduler":
+        """Build a scheduler from MODEL_* environment variables."""
+        return cls(
+            max_concurrency=int(os.getenv("MODEL_MAX_CONCURRENCY", "20")),
+            requests_per_minute=int(os.getenv("MODEL_RPM", "500")),
+            tokens_per_minute=int(os.getenv("MODEL_TPM", "200000")),
+            max_retries=int(os.getenv("MODEL_MAX_RETRIES", "5")),
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(queue) for queue in self._waiters.values())
+
+    async def _acquire(self, document_id: str) -> None:
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(document_id, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted just as we were cancelled, hand it on
+                self._release()
+            else:
+                queue = self._waiters.get(document_id)
+                if queue is not None and future in queue:
+                    queue.remove(future)
+                    if not queue:
+                        del self._waiters[document_id]
+            raise
+
+    def _release(self) -> None:
+        self._active -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._active < self.max_concurrency and self._waiters:
+            # Take the next document in rotation and move it to the back if it has more waiting
+            document_id, queue = self._waiters.popitem(last=False)
+            future = queue.popleft()
+            if queue:
+                self._waiters[document_id] = queue
+            if future.done():
+                continue
+            self._active += 1
+            future.set_result(None)
+
+    async def _reserve_budget(self, tokens: int) -> List[float]:
+        """Wait until the call fits the RPM/TPM window, then record it."""
+        async with self._budget_lock:
+            while True:
+                now = monotonic()
+                while self._window and now - self._window[0][0] >= WINDOW_SECONDS:
+                    self._window.popleft()
+
+                used_tokens = sum(entry[1] for entry in self._window)
+                fits_requests = len(self._window) < self.requests_per_minute
+                # A single call larger than the whole budget is let through on an empty window
+                fits_tokens = not self._window or used_tokens + tokens <= self.tokens_per_minute
+                if fits_requests and fits_tokens:
+                    entry = [now, float(tokens)]
+                    self._window.append(entry)
+                    return entry
+
+                await asyncio.sleep(WINDOW_SECONDS - (now - self._window[0][0]))
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def run(
+        self,
+        document_id: str,
+        call: Callable[[], Awaitable[T]],
+        estimated_tokens: int = 0,
+        count_tokens: Optional[Callable[[T], int]] = None,
+    ) -> T:
+        """
+        Run one model call under the shared limits.
+
+        :param document_id: Calls with the same id share one fair-queueing lane
+        :param call: Zero-argument factory for the awaitable, invoked once per attempt
+        :param estimated_tokens: Tokens to reserve against the TPM budget before the call
+        :param count_tokens: Returns the actual tokens used, to correct the reservation
+        """
+        attempt = 0
+        while True:
+            queued_at = monotonic()
+            await self._acquire(document_id)
+            waited = monotonic() - queued_at
+            self.wait_count += 1
+            self.total_wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            metrics.observe("supaocr_scheduler_wait_seconds", waited)
+
+            try:
+                entry = await self._reserve_budget(estimated_tokens)
+                self.requests += 1
+                result = await call()
+                if count_tokens is not None:
+                    entry[1] = float(count_tokens(result))
+                return result
+
+            except Exception as error:
+                if not is_rate_limit_error(error):
+                    self.failures += 1
+                    raise
+                self.rate_limited += 1
+                if attempt >= self.max_retries:
+                    self.failures += 1
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"Rate limited ({document_id}), retry {attempt + 1} in {delay:.1f}s")
+
+            finally:
+                self._release()
+
+            # Back off without holding a slot so other documents keep moving
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "active": self._active,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.queue_depth,
+            "queued_documents": len(self._waiters),
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "retries": self.retries,
+            "failures": self.failures,
+            "avg_wait_seconds": self.total_wait_seconds / self.wait_count if self.wait_count else 0.0,
+            "max_wait_seconds": self.max_wait_seconds,
+            "window_requests": len(self._window),
+            "window_tokens": int(sum(entry[1] for entry in self._window)),
+        }
@@ -0,0 +1,62 @@
+from typing import List, Sequence, Tuple
+
+# (x, y, text) in PDF points, origin at the bottom left
+Run = Tuple[float, float, str]
+
+LINE_HEIGHT = 14
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def prose(lines: Sequence[str], top: float = 740) -> List[Run]:
+    return [(60, top - index * LINE_HEIGHT, line) for index, line in enumerate(lines)]
+
+
+def table(rows: Sequence[Sequence[str]], columns: Sequence[float], top: float) -> List[Run]:
+    """One text run per cell, as word processors and invoicing tools write tables."""
+    return [
+        (x, top - index * LINE_HEIGHT, cell)
+        for index, row in enumerate(rows)
+        for x, cell in zip(columns, row)
+    ]
+
+
+def make_pdf(pages: Sequence[Sequence[Run]], image_pages: Sequence[int] = ()) -> bytes:
+    """A PDF with a Helvetica text layer. Pages whose index is in `image_pages` also draw a small image."""
+    objects: List[bytes] = [
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Type /XObject /Subtype /Image /Width 1 /Height 1 /ColorSpace /DeviceGray"
+        b" /BitsPerComponent 8 /Length 1 >>\nstream\n\x80\nendstream",
+    ]
+    contents = []
+    for index, runs in enumerate(pages):
+        ops = ["BT /F1 10 Tf"] + [f"1 0 0 1 {x} {y} Tm ({_escape(text)}) Tj" for x, y, text in runs] + ["ET"]
+        if index in image_pages:
+            ops.append("q 100 0 0 100 400 100 cm /Im1 Do Q")
+        stream = "\n".join(ops).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        contents.append(len(objects))
+
+    pages_id = len(objects) + len(pages) + 1
+    kids = []
+    for content in contents:
+        objects.append(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Contents %d 0 R"
+            b" /Resources << /Font << /F1 1 0 R >> /XObject << /Im1 2 0 R >> >> >>" % (pages_id, content)
+        )
+        kids.append(len(objects))
+    objects.append(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)))
+    objects.append(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, len(objects), xref)
+    return out
@@ -0,0 +1,36 @@
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+from encoding import PROFILES, encode_page
+
+# Rendered page size for US Letter at the default long side
+PAGE_SIZE = (816, 1056)
+
+
+def page_with(text):
+    image = Image.new("RGB", PAGE_SIZE, "white")
+    if text:
+        ImageDraw.Draw(image).text((80, 500), text, fill="black", font=ImageFont.load_default())
+    return image
+
+
+@pytest.mark.parametrize("text", ["Appendix A", "Total due: $1,250.00", "Signed ____________  Date 2024-01-05", "3"])
+def test_single_short_line_is_not_blank(text):
+    encoded = encode_page(page_with(text), PROFILES["adaptive"])
+    assert not encoded.blank
+    assert encoded.data
+
+
+def test_empty_page_is_blank():
+    assert encode_page(page_with(""), PROFILES["adaptive"]).blank
+
+
+def test_a_few_specks_are_blank():
+    image = page_with("")
+    for x in range(100, 400, 100):
+        image.putpixel((x, x), (0, 0, 0))
+    assert encode_page(image, PROFILES["adaptive"]).blank
+
+
+def test_png_profile_never_skips():
+    assert not encode_page(page_with(""), PROFILES["png"]).blank
@@ -0,0 +1,31 @@
+from formatting import build_anchor, can_conflict, conflicts
+
+ANCHOR = "# Annual Report\n\n## Summary\n\nRevenue grew in every region."
+
+
+def test_deeper_nesting_is_not_a_conflict():
+    assert not conflicts("### Europe\n\nSales rose.", "## Regions\n\nBy region.", ANCHOR)
+    assert not conflicts("### Europe\n\n#### Germany\n\nSales rose.", ANCHOR, ANCHOR)
+    assert not conflicts("## Outlook\n\nFlat.", "", ANCHOR)
+
+
+def test_new_top_level_is_not_a_conflict():
+    assert not conflicts("# Appendix\n\nNotes.", "## Costs\n\nFlat.", "## Costs")
+
+
+def test_skipped_heading_levels_conflict():
+    assert conflicts("#### Europe\n\nSales rose.", "## Regions\n\nBy region.", ANCHOR)
+    assert conflicts("###### Notes", "# Title", build_anchor("# Title"))
+
+
+def test_continued_table_with_other_columns_conflicts():
+    previous = "## Revenue\n\n| Region | Q1 |\n|---|---|\n| North | 1.2 |"
+    assert conflicts("| South | 0.9 | 5% |\n\nText.", previous, ANCHOR)
+    assert not conflicts("| South | 0.9 |\n\nText.", previous, ANCHOR)
+
+
+def test_only_pages_with_headings_or_a_leading_table_can_conflict():
+    assert can_conflict("## Costs\n\nFlat.")
+    assert can_conflict("| a | b |\n\nText.")
+    assert not can_conflict("Plain text.\n\n- a list\n\n| a | b |")
+    assert not can_conflict("")
@@ -0,0 +1,122 @@
+import asyncio
+import os
+
+import litellm
+import pytest
+
+import jobs
+from jobs import COMPLETED, FAILED, JobManager, JobStore
+from ocr import PageResult
+
+
+@pytest.fixture
+def upload(tmp_path):
+    path = tmp_path / "upload.pdf"
+    path.write_bytes(b"%PDF-1.4")
+    return str(path)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+def fake_stream(failing_runs):
+    """stream_pages stand-in over a 3 page document. Page 2 fails on the first `failing_runs` runs."""
+    requested = []
+
+    async def stream_pages(select_pages, **kwargs):
+        requested.append(select_pages)
+        for page in select_pages or [1, 2, 3]:
+            content = "" if page == 2 and len(requested) <= failing_runs else f"page {page}"
+            yield PageResult(content=content, content_length=len(content), page=page)
+
+    return stream_pages, requested
+
+
+async def run_job(store, upload, get_model, **options):
+    manager = JobManager(store, get_model, workers=1, retry_base_delay=0, **options)
+    await manager.start()
+    job_id = await manager.submit(upload, "upload.pdf", 8)
+    try:
+        for _ in range(200):
+            job = await manager.describe(job_id)
+            if job["status"] in (COMPLETED, FAILED):
+                return job
+            await asyncio.sleep(0.01)
+        raise AssertionError(f"job stuck in {job['status']}")
+    finally:
+        await manager.stop()
+
+
+@pytest.fixture(autouse=True)
+def three_pages(monkeypatch):
+    async def count_pages(path):
+        return 3
+    monkeypatch.setattr(jobs, "count_pages", count_pages)
+
+
+def test_transient_error_is_retried(monkeypatch, store, upload):
+    stream_pages, _ = fake_stream(failing_runs=0)
+    monkeypatch.setattr(jobs, "stream_pages", stream_pages)
+    calls = []
+
+    async def get_model():
+        calls.append(1)
+        if len(calls) == 1:
+            raise litellm.RateLimitError("slow down", llm_provider="openai", model="gpt-4o-mini")
+        return object()
+
+    job = asyncio.run(run_job(store, upload, get_model))
+    assert job["status"] == COMPLETED
+    assert job["attempts"] == 2
+    assert not os.path.exists(upload)
+
+
+def test_permanent_error_fails_and_removes_upload(monkeypatch, store, upload):
+    async def get_model():
+        raise ValueError("corrupt document")
+
+    job = asyncio.run(run_job(store, upload, get_model))
+    assert job["status"] == FAILED
+    assert job["attempts"] == 1
+    assert not os.path.exists(upload)
+
+
+def test_failed_pages_are_retried(monkeypatch, store, upload):
+    stream_pages, requested = fake_stream(failing_runs=1)
+    monkeypatch.setattr(jobs, "stream_pages", stream_pages)
+
+    async def get_model():
+        return object()
+
+    job = asyncio.run(run_job(store, upload, get_model))
+    assert job["status"] == COMPLETED
+    assert requested == [None, [2]]
+    assert job["failed_pages"] == []
+
+
+def test_failed_pages_are_reported_after_last_attempt(monkeypatch, store, upload):
+    stream_pages, requested = fake_stream(failing_runs=5)
+    monkeypatch.setattr(jobs, "stream_pages", stream_pages)
+
+    async def get_model():
+        return object()
+
+    job = asyncio.run(run_job(store, upload, get_model, max_attempts=2))
+    assert job["status"] == COMPLETED
+    assert requested == [None, [2]]
+    assert job["failed_pages"] == [2]
+
+
+def test_fresh_run_does_not_select_pages(monkeypatch, store, upload):
+    # select_pages with maintain_format warns, so only resumed runs may pass it
+    stream_pages, requested = fake_stream(failing_runs=0)
+    monkeypatch.setattr(jobs, "stream_pages", stream_pages)
+
+    async def get_model():
+        return object()
+
+    job = asyncio.run(run_job(store, upload, get_model, options={"maintain_format": True}))
+    assert job["status"] == COMPLETED
+    assert requested == [None]
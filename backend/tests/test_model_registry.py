@@ -0,0 +1,101 @@
+import asyncio
+
+import litellm
+import pytest
+from pyzerox.errors import ModelAccessError
+
+import model_registry
+from model_registry import ModelRegistry
+from scheduler import ModelScheduler
+
+
+class Provider:
+    """Stands in for litellm.acompletion, failing with whatever `error` is set to."""
+
+    def __init__(self):
+        self.calls = 0
+        self.error = None
+        self.kwargs = None
+
+    async def __call__(self, **kwargs):
+        self.calls += 1
+        self.kwargs = kwargs
+        if self.error is not None:
+            raise self.error
+        return {"choices": [{"message": {"content": "hi"}}]}
+
+
+def rate_limit_error():
+    return litellm.RateLimitError("slow down", llm_provider="openai", model="gpt-4o-mini")
+
+
+def auth_error():
+    return litellm.AuthenticationError("bad key", llm_provider="openai", model="gpt-4o-mini")
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    provider = Provider()
+    monkeypatch.setattr(model_registry.litellm, "acompletion", provider)
+    return provider
+
+
+def test_validates_once_and_reuses_instance(provider):
+    async def run():
+        registry = ModelRegistry()
+        first = await registry.get("gpt-4o-mini")
+        second = await registry.get("gpt-4o-mini")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first is second
+    assert provider.calls == 1
+
+
+def test_failed_refresh_keeps_serving_validated_model(provider):
+    async def run():
+        registry = ModelRegistry(validation_ttl=0)
+        instance = await registry.get("gpt-4o-mini")
+        provider.error = rate_limit_error()
+        # Expired, so this starts a background refresh that fails
+        assert await registry.get("gpt-4o-mini") is instance
+        await asyncio.sleep(0)
+        await asyncio.gather(*registry._pending.values())
+        provider.error = auth_error()
+        assert await registry.get("gpt-4o-mini") is instance
+        return registry
+
+    registry = asyncio.run(run())
+    assert registry.stats()["models"]["gpt-4o-mini"]["valid"]
+
+
+def test_transient_failure_is_not_cached(provider):
+    async def run():
+        registry = ModelRegistry()
+        provider.error = rate_limit_error()
+        with pytest.raises(litellm.RateLimitError):
+            await registry.get("gpt-4o-mini")
+        provider.error = None
+        return await registry.get("gpt-4o-mini")
+
+    assert asyncio.run(run()) is not None
+    assert provider.calls == 2
+
+
+def test_access_failure_is_cached_until_it_expires(provider):
+    async def run():
+        registry = ModelRegistry()
+        provider.error = auth_error()
+        for _ in range(2):
+            with pytest.raises(ModelAccessError):
+                await registry.get("gpt-4o-mini")
+
+    asyncio.run(run())
+    assert provider.calls == 1
+
+
+def test_access_check_runs_through_scheduler_without_sdk_retries(provider):
+    pool = ModelScheduler()
+    asyncio.run(ModelRegistry(scheduler=pool).get("gpt-4o-mini"))
+    assert pool.requests == 1
+    assert provider.kwargs["max_retries"] == 0
@@ -0,0 +1,83 @@
+import asyncio
+import os
+
+from page_cache import CachedPage, PageCache, page_cache_key
+
+
+def page(content, input_tokens=0, output_tokens=0, latency=0.0):
+    return CachedPage(content=content, input_tokens=input_tokens, output_tokens=output_tokens, latency=latency)
+
+
+def test_key_covers_completion_kwargs():
+    base = page_cache_key(b"image", "gpt-4o-mini", "prompt")
+    assert page_cache_key(b"image", "gpt-4o-mini", "prompt", completion_kwargs={}) == base
+    assert page_cache_key(b"image", "gpt-4o-mini", "prompt", completion_kwargs={"max_tokens": 50}) != base
+    assert page_cache_key(b"image", "gpt-4o-mini", "prompt", completion_kwargs={"a": 1, "b": 2}) \
+        == page_cache_key(b"image", "gpt-4o-mini", "prompt", completion_kwargs={"b": 2, "a": 1})
+
+
+def test_memory_tier_evicts_least_recently_used():
+    async def run():
+        cache = PageCache(max_memory_entries=2)
+        await cache.put("a", page("A"))
+        await cache.put("b", page("B"))
+        await cache.get("a")
+        await cache.put("c", page("C"))
+        return [await cache.get(key) is not None for key in ("a", "b", "c")]
+
+    assert asyncio.run(run()) == [True, False, True]
+
+
+def test_disk_tier_stays_within_byte_bound(tmp_path):
+    async def run():
+        cache = PageCache(max_memory_entries=0, disk_dir=str(tmp_path), max_disk_bytes=300)
+        for key in ("a", "b", "c", "d"):
+            await cache.put(key, page(key * 80))
+        return cache
+
+    cache = asyncio.run(run())
+    stats = cache.stats()
+    on_disk = sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path))
+    assert stats["disk_bytes"] == on_disk <= 300
+    # The oldest entries went first
+    assert not (tmp_path / "a.json").exists()
+    assert (tmp_path / "d.json").exists()
+
+
+def test_disk_index_is_reloaded_on_restart(tmp_path):
+    async def run():
+        first = PageCache(disk_dir=str(tmp_path))
+        await first.put("a", page("A", input_tokens=10))
+        second = PageCache(disk_dir=str(tmp_path))
+        return second.stats()["disk_entries"], await second.get("a"), second.stats()["disk_hits"]
+
+    entries, cached, disk_hits = asyncio.run(run())
+    assert entries == 1
+    assert cached == page("A", input_tokens=10)
+    assert disk_hits == 1
+
+
+def test_reload_evicts_down_to_a_smaller_bound(tmp_path):
+    async def run():
+        cache = PageCache(disk_dir=str(tmp_path))
+        for key in ("a", "b", "c"):
+            await cache.put(key, page(key * 80))
+        return os.path.getsize(tmp_path / "c.json")
+
+    size = asyncio.run(run())
+    reloaded = PageCache(disk_dir=str(tmp_path), max_disk_bytes=size)
+    assert reloaded.stats()["disk_entries"] == 1
+
+
+def test_hits_count_saved_tokens_and_misses_do_not(tmp_path):
+    async def run():
+        cache = PageCache(disk_dir=str(tmp_path))
+        await cache.put("a", page("A", input_tokens=100, output_tokens=20, latency=1.5))
+        await cache.get("a")
+        await cache.get("a")
+        await cache.get("missing")
+        return cache.stats()
+
+    stats = asyncio.run(run())
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    assert (stats["saved_input_tokens"], stats["saved_output_tokens"], stats["saved_seconds"]) == (200, 40, 3.0)
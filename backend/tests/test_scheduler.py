@@ -0,0 +1,190 @@
+import asyncio
+from time import monotonic
+
+import litellm
+import pytest
+
+import ocr
+import scheduler
+from metrics import metrics
+from model_registry import ModelRegistry
+from scheduler import ModelScheduler
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+def test_round_robin_between_documents():
+    async def run():
+        pool = ModelScheduler(max_concurrency=1)
+        order = []
+
+        def call(name):
+            async def make():
+                await asyncio.sleep(0)
+                order.append(name)
+            return make
+
+        large = [pool.run("large", call(f"large-{index}")) for index in range(6)]
+        small = [pool.run("small", call(f"small-{index}")) for index in range(2)]
+        await asyncio.gather(*large, *small)
+        return order
+
+    order = asyncio.run(run())
+    # Slots alternate between the documents instead of draining the large one first
+    assert order[:5] == ["large-0", "large-1", "small-0", "large-2", "small-1"]
+
+
+def test_requests_per_minute_window_waits(monkeypatch):
+    monkeypatch.setattr(scheduler, "WINDOW_SECONDS", 0.2)
+
+    async def run():
+        pool = ModelScheduler(requests_per_minute=2)
+        started = []
+
+        async def call():
+            started.append(monotonic())
+
+        await asyncio.gather(*(pool.run("doc", call) for _ in range(3)))
+        return started
+
+    started = asyncio.run(run())
+    assert started[1] - started[0] < 0.1
+    assert started[2] - started[0] >= 0.19
+
+
+def test_tokens_per_minute_window_waits(monkeypatch):
+    monkeypatch.setattr(scheduler, "WINDOW_SECONDS", 0.2)
+
+    async def run():
+        pool = ModelScheduler(tokens_per_minute=100)
+        started = []
+
+        async def call():
+            started.append(monotonic())
+            return 60
+
+        # The actual usage replaces the estimate, so the second call fits once the first leaves the window
+        await asyncio.gather(*(pool.run("doc", call, estimated_tokens=60, count_tokens=lambda used: used)
+                               for _ in range(2)))
+        return started
+
+    started = asyncio.run(run())
+    assert started[1] - started[0] >= 0.19
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        pool = ModelScheduler(max_concurrency=1)
+        await pool._acquire("a")
+        waiter = asyncio.create_task(pool._acquire("b"))
+        await asyncio.sleep(0)
+        assert pool.queue_depth == 1
+
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert pool.queue_depth == 0 and not pool._waiters
+
+        pool._release()
+        return pool._active
+
+    assert asyncio.run(run()) == 0
+
+
+def test_slot_granted_to_cancelled_waiter_is_handed_on():
+    async def run():
+        pool = ModelScheduler(max_concurrency=1)
+        await pool._acquire("a")
+        cancelled = asyncio.create_task(pool._acquire("b"))
+        await asyncio.sleep(0)
+        following = asyncio.create_task(pool._acquire("c"))
+        await asyncio.sleep(0)
+
+        # The slot goes to "b", which is cancelled before it gets to run
+        pool._release()
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        await asyncio.wait_for(following, 1)
+        return pool._active, pool.queue_depth
+
+    assert asyncio.run(run()) == (1, 0)
+
+
+def test_raises_after_retries_run_out():
+    async def run():
+        pool = ModelScheduler(max_retries=2, base_delay=0.001)
+        attempts = 0
+
+        async def call():
+            nonlocal attempts
+            attempts += 1
+            raise RateLimited("slow down")
+
+        with pytest.raises(RateLimited):
+            await pool.run("doc", call)
+        return attempts, pool.stats()
+
+    attempts, stats = asyncio.run(run())
+    assert attempts == 3
+    assert (stats["requests"], stats["rate_limited"], stats["retries"], stats["failures"]) == (3, 3, 2, 1)
+    assert stats["active"] == 0
+
+
+def test_other_errors_are_not_retried():
+    async def run():
+        pool = ModelScheduler(base_delay=0.001)
+        attempts = 0
+
+        async def call():
+            nonlocal attempts
+            attempts += 1
+            raise ValueError("bad request")
+
+        with pytest.raises(ValueError):
+            await pool.run("doc", call)
+        return attempts
+
+    assert asyncio.run(run()) == 1
+
+
+def test_sdk_retries_are_disabled_under_the_scheduler(monkeypatch):
+    seen = []
+
+    async def acompletion(model, messages, **kwargs):
+        seen.append(kwargs)
+        raise litellm.RateLimitError("slow down", llm_provider="openai", model=model)
+
+    monkeypatch.setattr(ocr.litellm, "acompletion", acompletion)
+    model = ModelRegistry()._build("gpt-4o-mini", None, {"temperature": 0})
+    pool = ModelScheduler(max_retries=1, base_delay=0.001)
+
+    content, _, _ = asyncio.run(ocr.process_page(b"image", model, scheduler=pool, document_id="doc"))
+    assert content == ""
+    # Every HTTP attempt is one the scheduler counted
+    assert len(seen) == pool.requests == 2
+    assert all(kwargs["max_retries"] == 0 and kwargs["temperature"] == 0 for kwargs in seen)
+
+
+def test_waits_are_observed_as_a_histogram():
+    async def run():
+        pool = ModelScheduler(max_concurrency=1)
+
+        async def call():
+            await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(pool.run("doc", call) for _ in range(3)))
+
+    # Histograms are process-wide, so compare against the count before
+    count = _wait_count()
+    asyncio.run(run())
+    assert _wait_count() == count + 3
+
+
+def _wait_count() -> int:
+    for line in metrics.render().splitlines():
+        if line.startswith("supaocr_scheduler_wait_seconds_count"):
+            return int(float(line.split()[-1]))
+    return 0
@@ -0,0 +1,158 @@
+import asyncio
+import base64
+import io
+from collections import Counter
+
+import pytest
+from PIL import Image, ImageDraw
+from PyPDF2 import PdfReader
+
+import ocr
+import rasterize
+from model_registry import ModelRegistry
+from pdfs import make_pdf, prose
+
+PROSE = [
+    "This born digital page has a clean text layer that can be converted locally without",
+    "calling the vision model, because it holds nothing but plain running paragraphs of",
+    "prose with ordinary words, sentences and punctuation across several full lines.",
+]
+
+
+def write_document(tmp_path, monkeypatch, pages, blank_pages=()):
+    """Write a PDF and render its pages as scans whose width encodes the page number."""
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(make_pdf(pages))
+
+    def convert_from_path(local_path, first_page, last_page, **kwargs):
+        images = []
+        for page in range(first_page, last_page + 1):
+            image = Image.new("RGB", (600 + 10 * page, 1056), "white")
+            if page not in blank_pages:
+                ImageDraw.Draw(image).text((80, 80), f"Scanned page {page} " * 8, fill="black")
+            images.append(image)
+        return images
+
+    monkeypatch.setattr(rasterize, "convert_from_path", convert_from_path)
+    monkeypatch.setattr(rasterize, "pdfinfo_from_path", lambda local_path: {"Pages": len(PdfReader(local_path).pages)})
+    return str(path)
+
+
+def page_of(messages):
+    """The page number a model call was made for, read back from the image width."""
+    url = messages[-1]["content"][0]["image_url"]["url"]
+    image = Image.open(io.BytesIO(base64.b64decode(url.split(",", 1)[1])))
+    return (image.width - 600) // 10
+
+
+@pytest.fixture
+def document(tmp_path, monkeypatch):
+    """Four pages: 2 has a clean text layer, 4 renders blank, 1 and 3 need the model."""
+    return write_document(tmp_path, monkeypatch, [[], prose(PROSE + PROSE), [], []], blank_pages={4})
+
+
+@pytest.fixture
+def model_calls(monkeypatch):
+    calls = []
+
+    async def acompletion(model, messages, **kwargs):
+        calls.append(messages)
+        await asyncio.sleep(0.01)
+        return {
+            "choices": [{"message": {"content": f"model output {len(calls)}"}}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1},
+        }
+
+    monkeypatch.setattr(ocr.litellm, "acompletion", acompletion)
+    return calls
+
+
+def collect(text_layer_min_quality=0.8, **options):
+    async def run():
+        return [page async for page in ocr.stream_pages(
+            model=ModelRegistry()._build("gpt-4o-mini", None, {}), text_layer_min_quality=text_layer_min_quality,
+            **options,
+        )]
+    return asyncio.run(run())
+
+
+def prior_page(messages):
+    """The previous page's markdown a model call was given as format context, or None."""
+    for message in messages[1:]:
+        if message["role"] == "system":
+            return message["content"]
+    return None
+
+
+def test_sequential_format_keeps_page_order(document, model_calls):
+    pages = collect(file_path=document, maintain_format=True, format_mode="sequential")
+
+    assert [page.page for page in pages] == [1, 2, 3, 4]
+    assert [page.route for page in pages] == ["model", "text", "model", "blank"]
+    # Page 1 comes first and has no context; page 3 is formatted against page 2's text layer
+    assert prior_page(model_calls[0]) is None
+    assert "born digital page" in prior_page(model_calls[1])
+
+
+def test_every_page_is_yielded_once(document, model_calls):
+    pages = collect(file_path=document, concurrency=4)
+    assert sorted(page.page for page in pages) == [1, 2, 3, 4]
+    assert len(model_calls) == 2
+
+
+def test_anchored_checks_against_final_predecessor(tmp_path, monkeypatch):
+    path = write_document(tmp_path, monkeypatch, [[], [], []])
+    # (first pass, re-run) markdown per page; page 2 skips heading levels, and page 3 continues
+    # the table only page 2's re-run ends with, with a different number of columns
+    outputs = {
+        1: ["# Report\n\n## Summary\n\nRevenue grew."],
+        2: ["#### Details\n\nCosts were flat.", "## Details\n\n| Region | Q1 |\n|---|---|\n| North | 1.2 |"],
+        3: ["| South | 0.9 | 5% |\n\nMore text.", "| South | 0.9 |\n\nMore text."],
+    }
+    calls = Counter()
+    contexts = {}
+
+    async def acompletion(model, messages, **kwargs):
+        page = page_of(messages)
+        calls[page] += 1
+        contexts[page, calls[page]] = prior_page(messages)
+        # Re-runs are slow, so page 3's first pass is done long before page 2 is final
+        await asyncio.sleep(0.2 if calls[page] > 1 else 0.01)
+        content = outputs[page][calls[page] - 1]
+        return {"choices": [{"message": {"content": content}}], "usage": {"prompt_tokens": 1, "completion_tokens": 1}}
+
+    monkeypatch.setattr(ocr.litellm, "acompletion", acompletion)
+    pages = {page.page: page for page in collect(
+        text_layer_min_quality=None, file_path=path, maintain_format=True, format_mode="anchored", concurrency=4,
+    )}
+
+    assert sorted(pages) == [1, 2, 3]
+    assert not pages[1].reformatted
+    assert pages[2].reformatted and pages[3].reformatted
+    assert pages[3].content == outputs[3][1]
+    assert "| North | 1.2 |" in contexts[3, 2]
+
+
+def test_anchored_caps_pages_held_behind_a_slow_page(tmp_path, monkeypatch):
+    path = write_document(tmp_path, monkeypatch, [[]] * 8)
+    started = {}
+    done = {}
+
+    async def acompletion(model, messages, **kwargs):
+        page = page_of(messages)
+        started[page] = asyncio.get_running_loop().time()
+        await asyncio.sleep(0.3 if page == 2 else 0.01)
+        done[page] = asyncio.get_running_loop().time()
+        content = f"# Report\n\n## Part {page}\n\nText." if page == 1 else f"## Part {page}\n\nText."
+        return {"choices": [{"message": {"content": content}}], "usage": {"prompt_tokens": 1, "completion_tokens": 1}}
+
+    monkeypatch.setattr(ocr.litellm, "acompletion", acompletion)
+    pages = collect(
+        text_layer_min_quality=None, file_path=path, maintain_format=True, format_mode="anchored",
+        concurrency=3, max_buffered_pages=1,
+    )
+
+    assert sorted(page.page for page in pages) == list(range(1, 9))
+    # Page 3 holds the one slot behind page 2 and pages 4 and 5 block their workers,
+    # so nothing past page 5 is sent until page 2 is back
+    assert min(started[page] for page in (6, 7, 8)) >= done[2]
@@ -0,0 +1,76 @@
+import text_layer
+from pdfs import make_pdf, prose, table
+from text_layer import DEFAULT_MIN_QUALITY, TextLayer, text_to_markdown
+
+PROSE = [
+    "The consulting engagement covered the migration of the billing platform and the",
+    "review of the supplier contracts that were signed during the previous fiscal year.",
+    "All work was performed on site and remotely according to the agreed schedule.",
+]
+
+LINE_ITEMS = [
+    ["Description", "Qty", "Rate", "Amount"],
+    ["Consulting services", "10", "150.00", "1500.00"],
+    ["Travel", "2", "300.00", "600.00"],
+    ["Software licence", "1", "900.00", "900.00"],
+]
+
+
+def layer(tmp_path, runs, image_pages=()):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(make_pdf([runs], image_pages=image_pages))
+    return TextLayer(str(path))
+
+
+def test_clean_prose_is_converted(tmp_path):
+    markdown = layer(tmp_path, prose(PROSE + PROSE)).markdown(1, DEFAULT_MIN_QUALITY)
+    assert markdown is not None
+    assert "billing platform" in markdown
+
+
+def test_page_with_table_goes_to_model(tmp_path):
+    runs = prose(PROSE) + table(LINE_ITEMS, columns=[60, 300, 380, 460], top=680) + prose(PROSE, top=600)
+    assert layer(tmp_path, runs).markdown(1, DEFAULT_MIN_QUALITY) is None
+
+
+def test_table_without_numbers_goes_to_model(tmp_path):
+    rows = [["Name", "Role", "Team"], ["Alice Smith", "Engineer", "Platform"],
+            ["Bob Jones", "Designer", "Growth"], ["Carol White", "Manager", "Platform"]]
+    runs = prose(PROSE) + table(rows, columns=[60, 250, 400], top=680) + prose(PROSE, top=600)
+    assert layer(tmp_path, runs).markdown(1, DEFAULT_MIN_QUALITY) is None
+
+
+def test_numeric_rows_go_to_model_even_without_positions():
+    # What PyPDF2 returns for a table: cells joined by single spaces
+    text = "\n".join(PROSE + ["Consulting services 10 150.00 1500.00", "Travel 2 300.00 600.00"] + PROSE)
+    from text_layer import looks_tabular
+    assert looks_tabular(text)
+    assert not looks_tabular("\n".join(PROSE + ["Total 3240.00"]))
+
+
+def test_page_with_image_goes_to_model(tmp_path):
+    assert layer(tmp_path, prose(PROSE + PROSE), image_pages=[0]).markdown(1, DEFAULT_MIN_QUALITY) is None
+
+
+def test_fields_are_not_headings():
+    markdown = text_to_markdown("\n".join(["INVOICE", "Date: 2024-01-05"] + PROSE + ["Tax 240.00", "Total 3240.00"]))
+    assert markdown.startswith("## INVOICE")
+    assert "## Date" not in markdown
+    assert "## Tax" not in markdown
+    assert "## Total" not in markdown
+
+
+def test_layout_before_extract_opens_the_reader(tmp_path, monkeypatch):
+    readers = []
+
+    def analyze_layout(reader, page):
+        readers.append(reader)
+        return real_analyze_layout(reader, page)
+
+    real_analyze_layout = text_layer.analyze_layout
+    monkeypatch.setattr(text_layer, "analyze_layout", analyze_layout)
+    runs = prose(PROSE) + table(LINE_ITEMS, columns=[60, 300, 380, 460], top=680)
+    layout = layer(tmp_path, runs).layout(1)
+
+    assert layout is not None and layout.tabular
+    assert readers[0] is not None
@@ -0,0 +1,312 @@
+import logging
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+from PyPDF2 import PdfReader
+from PyPDF2._page import PageObject
+from PyPDF2.generic import ContentStream
+
+logger = logging.getLogger("supaocr.text_layer")
+
+# Recommended minimum score for converting a page locally instead of sending it to the
+# vision model. The fast path is off unless a threshold is passed.
+DEFAULT_MIN_QUALITY = 0.8
+
+# Fewer characters than this and the page is probably a scan, a figure or a cover
+MIN_CHARS = 200
+
+WORD = re.compile(r"[^\W\d_]{2,}")
+BULLET = re.compile(r"^\s*[•◦▪▫‣∙·\-*]\s+")
+NUMBERED = re.compile(r"^\s*(\d{1,3}|[a-zA-Z])[.)]\s+")
+# Runs of wide gaps inside a line usually mean a table the text layer has flattened
+COLUMN_GAP = re.compile(r"\S {3,}\S")
+NUMBER = re.compile(r"^[(\-+]?[$€£]?\d[\d,.]*%?\)?$")
+
+# Text runs starting within this many points of each other count as the same column
+COLUMN_TOLERANCE = 3.0
+# A table is at least this many lines with text starting at this many shared column positions
+MIN_TABLE_ROWS = 3
+MIN_TABLE_COLUMNS = 2
+# Lines with at least this many numbers look like table rows once cells are joined by spaces
+MIN_ROW_NUMBERS = 2
+MIN_NUMERIC_ROWS = 2
+# More path segments than this means charts, diagrams or ruled tables
+MAX_PATH_OPS = 40
+
+PATH_OPS = {b"m", b"l", b"c", b"v", b"y", b"re"}
+SHOW_TEXT_OPS = {b"Tj", b"TJ", b"'", b'"'}
+IDENTITY = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+
+
+@dataclass
+class PageLayout:
+    """What the content stream of a page draws besides running text."""
+
+    tabular: bool
+    graphics: bool
+
+
+class TextLayer:
+    """
+    Lazily extracted embedded text of a PDF, one page at a time.
+
+    Methods are blocking; call them through asyncio.to_thread from async code.
+    """
+
+    def __init__(self, local_path: str):
+        self.local_path = local_path
+        self._reader: Optional[PdfReader] = None
+
+    def _page(self, page_number: int) -> PageObject:
+        if self._reader is None:
+            self._reader = PdfReader(self.local_path)
+        return self._reader.pages[page_number - 1]
+
+    def extract(self, page_number: int) -> str:
+        """Embedded text of a 1-indexed page, or "" if there is none or it can't be read."""
+        try:
+            return self._page(page_number).extract_text() or ""
+        except Exception as err:
+            logger.warning(f"Could not read text layer of page {page_number}: {err}")
+            return ""
+
+    def layout(self, page_number: int) -> Optional[PageLayout]:
+        """Tables and graphics on a 1-indexed page, or None if its content stream can't be read."""
+        try:
+            # _page opens the reader on first use, so it must run before self._reader is read
+            page = self._page(page_number)
+            return analyze_layout(self._reader, page)
+        except Exception as err:
+            logger.warning(f"Could not analyze layout of page {page_number}: {err}")
+            return None
+
+    def markdown(self, page_number: int, min_quality: float = DEFAULT_MIN_QUALITY) -> Optional[str]:
+        """
+        Markdown for the page if its text layer is good enough to skip the vision model, else None.
+
+        Pages with tables, images or drawings always go to the model: the text layer
+        joins table cells with single spaces and has nothing for figures.
+        """
+        text = self.extract(page_number)
+        if score_text(text) < min_quality or looks_tabular(text):
+            return None
+        layout = self.layout(page_number)
+        if layout is None or layout.tabular or layout.graphics:
+            return None
+        return text_to_markdown(text)
+
+
+def _multiply(m: List[float], n: List[float]) -> List[float]:
+    """Product m × n of two PDF transformation matrices."""
+    return [
+        m[0] * n[0] + m[1] * n[2], m[0] * n[1] + m[1] * n[3],
+        m[2] * n[0] + m[3] * n[2], m[2] * n[1] + m[3] * n[3],
+        m[4] * n[0] + m[5] * n[2] + n[4], m[4] * n[1] + m[5] * n[3] + n[5],
+    ]
+
+
+def text_positions(operations) -> List[Tuple[float, float]]:
+    """Page coordinates where each text showing operator starts drawing."""
+    positions = []
+    ctm, stack = IDENTITY, []
+    line_matrix = text_matrix = IDENTITY
+    leading = 0.0
+
+    def next_line(tx: float, ty: float) -> None:
+        nonlocal line_matrix, text_matrix
+        line_matrix = text_matrix = _multiply([1.0, 0.0, 0.0, 1.0, tx, ty], line_matrix)
+
+    for operands, operator in operations:
+        if operator == b"q":
+            stack.append(ctm)
+        elif operator == b"Q":
+            ctm = stack.pop() if stack else IDENTITY
+        elif operator == b"cm":
+            ctm = _multiply([float(value) for value in operands], ctm)
+        elif operator == b"BT":
+            line_matrix = text_matrix = IDENTITY
+        elif operator == b"Tm":
+            line_matrix = text_matrix = [float(value) for value in operands]
+        elif operator in (b"Td", b"TD"):
+            if operator == b"TD":
+                leading = -float(operands[1])
+            next_line(float(operands[0]), float(operands[1]))
+        elif operator == b"TL":
+            leading = float(operands[0])
+        elif operator == b"T*":
+            next_line(0.0, -leading)
+        elif operator in SHOW_TEXT_OPS:
+            if operator in (b"'", b'"'):
+                next_line(0.0, -leading)
+            origin = _multiply(text_matrix, ctm)
+            positions.append((origin[4], origin[5]))
+    return positions
+
+
+def has_aligned_columns(positions: List[Tuple[float, float]]) -> bool:
+    """
+    True when several lines have separate text runs starting at the same x positions.
+
+    Tables are drawn one run per cell, so their cells line up across rows; running
+    text is drawn one run per line (or per word, at positions that rarely repeat).
+    """
+    lines: Dict[int, Set[int]] = defaultdict(set)
+    for x, y in positions:
+        lines[round(y)].add(round(x / COLUMN_TOLERANCE))
+
+    columns: Counter = Counter()
+    for starts in lines.values():
+        if len(starts) >= MIN_TABLE_COLUMNS:
+            columns.update(starts)
+    aligned = [column for column, rows in columns.items() if rows >= MIN_TABLE_ROWS]
+    return len(aligned) >= MIN_TABLE_COLUMNS
+
+
+def analyze_layout(reader: PdfReader, page: PageObject) -> PageLayout:
+    contents = page.get_contents()
+    if contents is None:
+        return PageLayout(tabular=False, graphics=False)
+    operations = ContentStream(contents, reader).operations
+
+    resources = page.get("/Resources")
+    resources = resources.get_object() if resources is not None else {}
+    xobjects = resources.get("/XObject")
+    xobjects = xobjects.get_object() if xobjects is not None else {}
+    graphics = False
+    paths = 0
+    for operands, operator in operations:
+        if operator == b"INLINE IMAGE":
+            graphics = True
+        elif operator == b"Do" and operands:
+            # Images, and forms that may hold images or drawings
+            xobject = xobjects.get(operands[0])
+            if xobject is not None and xobject.get_object().get("/Subtype") in ("/Image", "/Form"):
+                graphics = True
+        elif operator in PATH_OPS:
+            paths += 1
+
+    return PageLayout(
+        tabular=has_aligned_columns(text_positions(operations)),
+        graphics=graphics or paths > MAX_PATH_OPS,
+    )
+
+
+def looks_tabular(text: str) -> bool:
+    """True when several lines carry multiple numbers, like table rows with their cells joined by spaces."""
+    numeric_rows = sum(
+        1 for line in text.splitlines()
+        if sum(1 for token in line.split() if NUMBER.match(token)) >= MIN_ROW_NUMBERS
+    )
+    return numeric_rows >= MIN_NUMERIC_ROWS
+
+
+def score_text(text: str) -> float:
+    """
+    Score how usable an extracted text layer is, from 0 (unusable) to 1 (clean prose).
+
+    Penalises pages that are too short, contain undecodable glyphs, are mostly
+    non-word tokens (garbled encodings, OCR noise) or look like flattened tables.
+    """
+    stripped = text.strip()
+    if len(stripped) < MIN_CHARS:
+        return 0.0
+    if "�" in stripped or "(cid:" in stripped:
+        return 0.0
+
+    printable = sum(1 for c in stripped if c.isprintable() or c in "\n\t") / len(stripped)
+
+    tokens = stripped.split()
+    words = sum(1 for token in tokens if WORD.search(token))
+    word_ratio = words / len(tokens) if tokens else 0.0
+
+    average_length = sum(len(token) for token in tokens) / len(tokens) if tokens else 0.0
+    # Text extracted without spaces, or split letter by letter, has implausible token lengths
+    length_ok = 1.0 if 2.5 <= average_length <= 12 else 0.5
+
+    lines = [line for line in stripped.splitlines() if line.strip()]
+    tabular = sum(1 for line in lines if COLUMN_GAP.search(line)) / len(lines) if lines else 0.0
+
+    return printable * word_ratio * length_ok * (1.0 - tabular)
+
+
+def _is_heading(line: str, next_line: str) -> bool:
+    if len(line) > 80 or line.endswith((".", ",", ";", ":")) or BULLET.match(line):
+        return False
+    words = line.split()
+    if not words or len(words) > 10:
+        return False
+    # "Date: 2024-01-05" and "Total 3240.00" are fields, not headings
+    if ":" in line or any(any(c.isdigit() for c in word) for word in words[1:]):
+        return False
+    capitalised = sum(1 for word in words if word[:1].isupper() or not word[:1].isalpha())
+    if line.isupper():
+        return True
+    return capitalised == len(words) and (not next_line or len(next_line) > len(line))
+
+
+def text_to_markdown(text: str) -> str:
+    """
+    Turn an extracted text layer into markdown.
+
+    Rejoins hyphenated and wrapped lines into paragraphs, normalises bullets and marks
+    short title-like lines as headings. Anything else is kept as plain paragraphs.
+    """
+    lines = [line.strip() for line in text.replace("\r", "").splitlines()]
+    blocks: List[str] = []
+    paragraph = ""
+    previous = ""
+
+    # Text layers rarely contain blank lines, so a short line ending a sentence ends a paragraph
+    lengths = sorted(len(line) for line in lines if line)
+    full_width = lengths[int(len(lengths) * 0.9)] if lengths else 0
+
+    def flush() -> None:
+        nonlocal paragraph
+        if paragraph:
+            blocks.append(paragraph)
+            paragraph = ""
+
+    for index, line in enumerate(lines):
+        if not line:
+            flush()
+            continue
+
+        next_line = next((candidate for candidate in lines[index + 1:] if candidate), "")
+        if paragraph and len(previous) < 0.8 * full_width and (
+            previous.endswith((".", "!", "?", ":")) or _is_heading(line, next_line)
+        ):
+            flush()
+        previous = line
+
+        if BULLET.match(line):
+            flush()
+            paragraph = "- " + BULLET.sub("", line)
+        elif NUMBERED.match(line) and not paragraph.endswith("-"):
+            flush()
+            paragraph = line
+        elif not paragraph and _is_heading(line, next_line):
+            blocks.append("## " + line)
+        elif paragraph.endswith("-") and line[:1].islower():
+            # Hyphenated line break
+            paragraph = paragraph[:-1] + line
+        elif paragraph:
+            paragraph += " " + line
+        else:
+            paragraph = line
+
+    flush()
+
+    def item_kind(block: str) -> str:
+        if block.startswith("- "):
+            return "bullet"
+        return "numbered" if NUMBERED.match(block) else ""
+
+    markdown: List[str] = []
+    for block in blocks:
+        # Keep list items together, separate everything else by a blank line
+        if markdown and not (item_kind(block) and item_kind(block) == item_kind(markdown[-1])):
+            markdown.append("")
+        markdown.append(block)
+    return "\n".join(markdown)
@@ -0,0 +1,42 @@
+import { NextResponse } from 'next/server'
+
+const BACKEND_URL = process.env.BACKEND_URL || process.env.NEXT_PUBLIC_BACKEND_URL || 'http://localhost:8000'
+
+export async function POST(request: Request) {
+    console.log('🔵 [Debug] Starting streaming conversion request')
+
+    try {
+        const formData = await request.formData()
+        const file = formData.get('file') as File
+
+        if (!file) {
+            console.error('❌ [Debug] No file in request')
+            return NextResponse.json({ error: 'No file provided' }, { status: 400 })
+        }
+
+        // No overall timeout here: pages keep the connection alive as they arrive
+        const response = await fetch(`${BACKEND_URL}/convert/stream`, {
+            method: 'POST',
+            body: formData,
+        })
+
+        if (!response.ok || !response.body) {
+            const errorText = await response.text()
+            console.error('❌ [Debug] Backend error:', response.status, errorText)
+            return NextResponse.json({
+                error: `Backend failed with status ${response.status}`,
+                details: errorText
+            }, { status: response.status })
+        }
+
+        return new Response(response.body, {
+            headers: { 'Content-Type': 'application/x-ndjson' }
+        })
+    } catch (error: any) {
+        console.error('💥 [Debug] Request failed:', error)
+        return NextResponse.json({
+            error: 'Failed to process file',
+            details: error.message
+        }, { status: 500 })
+    }
+}
@@ -15,15 +15,10 @@ interface PageContent {
     page_number: number;
 }
 
-interface ConversionResponse {
-    pages: PageContent[];
-    request_id: string;
-    stats: {
-        file_size: number;
-        total_pages: number;
-        total_chars: number;
-    };
-}
+type StreamRecord =
+    | ({ type: 'page'; input_tokens: number; output_tokens: number; cached: boolean } & PageContent)
+    | { type: 'stats'; request_id: string; stats: Record<string, number> }
+    | { type: 'error'; error: string; request_id: string }
 
 export function FileUploader({ onConversionComplete }: FileUploaderProps) {
     const [file, setFile] = useState<File | null>(null)
@@ -46,28 +41,53 @@ export function FileUploader({ onConversionComplete }: FileUploaderProps) {
         formData.append('file', file)
 
         try {
-            console.log('🔄 [FileUploader] Starting conversion')
-            const response = await fetch('/api/convert', {
+            console.log('🔄 [FileUploader] Starting streaming conversion')
+            const response = await fetch('/api/convert/stream', {
                 method: 'POST',
-                body: formData,
-                signal: AbortSignal.timeout(120000)
+                body: formData
             })
 
-            if (!response.ok) {
+            if (!response.ok || !response.body) {
                 console.error('❌ [FileUploader] Response not OK:', response.status)
                 throw new Error(`API returned ${response.status}`)
             }
 
-            const data = await response.json() as ConversionResponse
-            console.log('📄 [FileUploader] Pages received:', data.pages?.length)
-            console.log('📊 [FileUploader] Stats:', data.stats)
+            // Pages arrive in completion order; keep them sorted for display
+            const pages: PageContent[] = []
+            const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+            let buffer = ''
+            // The stats record closes a complete conversion; a stream that ends before it was cut off
+            let completed = false
+
+            while (true) {
+                const { done, value } = await reader.read()
+                if (done) {
+                    if (!completed) {
+                        throw new Error(`Stream ended after ${pages.length} pages without completing`)
+                    }
+                    break
+                }
+                buffer += value
+
+                const lines = buffer.split('\n')
+                buffer = lines.pop() ?? ''
+
+                for (const line of lines) {
+                    if (!line.trim()) continue
+                    const record = JSON.parse(line) as StreamRecord
 
-            if (data.pages) {
-                const markdown = data.pages.map((p: PageContent) => p.content).join('\n')
-                console.log('✨ [FileUploader] Generated markdown length:', markdown.length)
-                onConversionComplete(markdown, file)
-            } else {
-                throw new Error('Invalid response format')
+                    if (record.type === 'page') {
+                        pages.push({ content: record.content, page_number: record.page_number })
+                        pages.sort((a, b) => a.page_number - b.page_number)
+                        console.log('📄 [FileUploader] Page received:', record.page_number)
+                        onConversionComplete(pages.map(p => p.content).join('\n'), file)
+                    } else if (record.type === 'stats') {
+                        completed = true
+                        console.log('📊 [FileUploader] Stats:', record.stats)
+                    } else {
+                        throw new Error(record.error)
+                    }
+                }
             }
         } catch (error) {
             console.error('❌ [FileUploader] Error:', error)